@@ -0,0 +1,104 @@
+"""
+Shared llama.cpp model for AEGIS.
+
+MedicalLLM (agents/llm_engine.py) and QwenChatModel (agents/qwen_llm.py) both run
+the same Qwen2.5-7B GGUF. Loading it through get_llama() keeps a single copy in
+VRAM and pays the multi-second load only once per process.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+# Q4_K_M (~4.5GB) by default: decode is memory-bound, so halving the weight
+# bytes roughly doubles tokens/sec. QWEN_MODEL_PATH wins when set; otherwise
+# QWEN_QUANT=q8 selects the original Q8_0 shards.
+MODEL_PATH = os.getenv(
+    "QWEN_MODEL_PATH",
+    "agents/models/qwen2.5-7b-instruct-q8_0-00001-of-00003.gguf"
+    if os.getenv("QWEN_QUANT", "q4").lower() == "q8"
+    else "agents/models/qwen2.5-7b-instruct-q4_k_m.gguf"
+)
+
+DEFAULT_N_CTX = 16384           # Q4 weights free enough VRAM for a larger KV cache
+DEFAULT_N_GPU_LAYERS = -1       # Offload ALL layers to GPU
+
+# Speculative decoding: a small draft model proposes tokens that the 7B verifies in
+# one forward pass. Qwen2.5-0.5B shares the 7B tokenizer, so its ids are compatible.
+SPECULATIVE = os.getenv("AEGIS_SPECULATIVE", "0") == "1"
+DRAFT_MODEL_PATH = os.getenv(
+    "AEGIS_DRAFT_MODEL_PATH",
+    "agents/models/qwen2.5-0.5b-instruct-q4_k_m.gguf"
+)
+NUM_PRED_TOKENS = int(os.getenv("AEGIS_NUM_PRED_TOKENS", "5"))
+
+_instances: Dict[Tuple[str, int, int], Any] = {}
+_lock = threading.Lock()
+
+
+def _build_draft_model(model_path: str, n_ctx: int, num_pred_tokens: int):
+    """Wrap a small Llama as a llama-cpp-python draft model."""
+    import numpy as np
+    from llama_cpp import Llama
+    from llama_cpp.llama_speculative import LlamaDraftModel
+
+    class QwenDraftModel(LlamaDraftModel):
+        def __init__(self):
+            self.llm = Llama(
+                model_path=model_path,
+                n_ctx=n_ctx,
+                n_gpu_layers=-1,
+                verbose=False,
+            )
+
+        def __call__(self, input_ids, /, **kwargs):
+            # generate() reuses the longest cached prefix, so only new tokens are evaluated
+            draft = []
+            for token in self.llm.generate(input_ids.tolist(), temp=0.0):
+                draft.append(token)
+                if len(draft) >= num_pred_tokens:
+                    break
+            return np.array(draft, dtype=np.intc)
+
+    print(f"[LLAMA] Loading draft model {model_path} for speculative decoding...")
+    return QwenDraftModel()
+
+
+def get_llama(
+    model_path: str = MODEL_PATH,
+    n_ctx: int = DEFAULT_N_CTX,
+    n_gpu_layers: int = DEFAULT_N_GPU_LAYERS,
+):
+    """
+    Get or lazily create the shared Llama instance for this configuration.
+    Raises ImportError if llama_cpp is not installed.
+    """
+    key = (model_path, n_ctx, n_gpu_layers)
+    llm = _instances.get(key)
+    if llm is not None:
+        return llm
+
+    with _lock:
+        llm = _instances.get(key)
+        if llm is None:
+            from llama_cpp import Llama
+
+            draft_model = None
+            if SPECULATIVE:
+                draft_model = _build_draft_model(DRAFT_MODEL_PATH, n_ctx, NUM_PRED_TOKENS)
+
+            print(f"[LLAMA] Loading {model_path} on GPU... this might take a minute.")
+            llm = Llama(
+                model_path=model_path,
+                n_ctx=n_ctx,
+                n_threads=8,             # More threads for CPU offload
+                n_gpu_layers=n_gpu_layers,
+                n_batch=1024,            # Larger batch for GPU
+                use_mlock=True,          # Lock model in RAM to prevent swapping
+                use_mmap=True,           # Memory-map the model file
+                verbose=False,
+                draft_model=draft_model,
+            )
+            _instances[key] = llm
+            print("[LLAMA] Model loaded.")
+    return llm
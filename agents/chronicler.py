@@ -16,6 +16,7 @@ class ChroniclerAgent:
         """
         if not date_str:
             date_str = datetime.now().strftime("%Y-%m-%d")
+        summary_date = datetime.strptime(date_str, "%Y-%m-%d").date()
             
         print(f"[CHRONICLER] 📜 Summarizing day {date_str} for User {user_id}...")
         
@@ -98,7 +99,7 @@ class ChroniclerAgent:
             # 5. Save to Database
             existing = session.query(DailySummary).filter(
                 DailySummary.user_id == user_id,
-                DailySummary.date == date_str
+                DailySummary.date == summary_date
             ).first()
             
             if existing:
@@ -108,7 +109,7 @@ class ChroniclerAgent:
             else:
                 new_summary = DailySummary(
                     user_id=user_id,
-                    date=date_str,
+                    date=summary_date,
                     summary=summary_text,
                     mood=mood
                 )
@@ -179,11 +180,9 @@ class ChroniclerAgent:
             cutoff = datetime.now() - timedelta(days=7)
             
             # 1. Fetch Daily Summaries from past week
-            # Note: date column is VARCHAR, so compare as string
-            cutoff_str = cutoff.strftime("%Y-%m-%d")
             summaries = session.query(DailySummary).filter(
                 DailySummary.user_id == user_id,
-                DailySummary.date >= cutoff_str
+                DailySummary.date >= cutoff.date()
             ).order_by(DailySummary.date.desc()).all()
             
             # 2. Fetch Health Events (vitals) from past week
@@ -2,9 +2,15 @@ from typing import TypedDict, List, Annotated, Union
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from agents.llm_engine import generate_medical_response
+from agents.llm_engine import generate_medical_response, generate_medical_response_stream
 import os
 
+try:
+    # Lets nodes push tokens to app.stream(stream_mode="custom") consumers
+    from langgraph.config import get_stream_writer
+except ImportError:
+    get_stream_writer = None
+
 # ============================================================================
 # SLIDING WINDOW CONFIGURATION
 # ============================================================================
@@ -321,7 +327,16 @@ def reasoning_node(state: AgentState):
     
     # Use higher max_tokens when tool output contains location data (long formatted results)
     output_tokens = 1500 if has_tool_result else 512
-    response_text = generate_medical_response(prompt, max_tokens=output_tokens)
+    if get_stream_writer is not None:
+        # Forward tokens as they are generated; a no-op unless the graph is being streamed
+        writer = get_stream_writer()
+        chunks = []
+        for chunk in generate_medical_response_stream(prompt, max_tokens=output_tokens):
+            chunks.append(chunk)
+            writer(chunk)
+        response_text = "".join(chunks).strip()
+    else:
+        response_text = generate_medical_response(prompt, max_tokens=output_tokens)
     
     return {
         "messages": [AIMessage(content=response_text)],
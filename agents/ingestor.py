@@ -10,6 +10,11 @@ import io
 import re
 import time
 import os
+from functools import lru_cache
+from pathlib import Path
+
+# TF32 matmuls on Ampere+ GPUs (no effect on older cards or CPU)
+torch.backends.cuda.matmul.allow_tf32 = True
 
 class VisionAgent:
     _instance = None
@@ -20,6 +25,7 @@ class VisionAgent:
             cls._instance.model = None
             cls._instance.processor = None
             cls._instance.device = None
+            cls._instance._chat_text_cache = {}
             cls._instance.load_model()
         return cls._instance
 
@@ -30,9 +36,15 @@ class VisionAgent:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
             print(f"Using device: {self.device}")
             
+            # bf16 on Ampere+ (compute capability >= 8): same bandwidth as fp16, no overflow
+            if self.device == "cuda":
+                dtype = torch.bfloat16 if torch.cuda.get_device_capability()[0] >= 8 else torch.float16
+            else:
+                dtype = torch.float32
+            
             self.model = Qwen2VLForConditionalGeneration.from_pretrained(
                 "Qwen/Qwen2-VL-2B-Instruct",
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                torch_dtype=dtype,
                 device_map="auto",  # Automatically distribute across GPUs
                 low_cpu_mem_usage=True,  # Optimize memory usage
             )
@@ -84,9 +96,14 @@ Mock Data (Dependency Missing)"""
             }
         ]
         
-        text = self.processor.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
+        # The rendered template only holds an image placeholder, so it depends on the
+        # prompt alone; render it once per prompt instead of once per page.
+        text = self._chat_text_cache.get(prompt_text)
+        if text is None:
+            text = self.processor.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True
+            )
+            self._chat_text_cache[prompt_text] = text
         
         image_inputs, video_inputs = process_vision_info(messages)
         
@@ -98,44 +115,34 @@ Mock Data (Dependency Missing)"""
             return_tensors="pt",
         )
         
-        inputs = inputs.to(self.device)
+        with torch.inference_mode():
+            inputs = inputs.to(self.device)
         
-        generated_ids = self.model.generate(
-            **inputs, 
-            max_new_tokens=1024,  # Reduced - medical records don't need 2048 tokens
-            repetition_penalty=1.15,  # Penalize repeated tokens
-            no_repeat_ngram_size=3,  # Prevent repeating 3-grams
-            do_sample=False,  # Deterministic output for medical accuracy
-        )
+            generated_ids = self.model.generate(
+                **inputs, 
+                max_new_tokens=1024,  # Reduced - medical records don't need 2048 tokens
+                repetition_penalty=1.15,  # Penalize repeated tokens
+                no_repeat_ngram_size=3,  # Prevent repeating 3-grams
+                do_sample=False,  # Deterministic output for medical accuracy
+            )
         
-        generated_ids_trimmed = [
-            out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-        ]
+            # Inputs are padded to a common length, so trim the prompt with one slice
+            input_len = inputs.input_ids.shape[1]
+            generated_ids_trimmed = generated_ids[:, input_len:]
         
-        output_text = self.processor.batch_decode(
-            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )
+            output_text = self.processor.batch_decode(
+                generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+            )
         
-        return output_text[0]
+            return output_text[0]
 
 ingestor = VisionAgent()
 
-def strip_html_tags(text: str) -> str:
-    """Remove HTML tags from text, leaving only the content."""
-    # Remove HTML tags but keep the text content
-    clean = re.sub(r'<[^>]+>', '', text)
-    # Remove excessive whitespace
-    clean = re.sub(r'\n\s*\n\s*\n+', '\n\n', clean)
-    return clean.strip()
-
-def extract_medical_data(image_path: str, user_id: int = None) -> dict:
-    """
-    Extracts medical data from the given image path using the Vision Agent.
-    Supports PDF files by converting ALL pages to images and performing OCR.
-    Returns a dict with markdown-formatted text (better for LLM reasoning).
-    """
-    # Markdown Prompt
-    markdown_prompt = """
+# Transcription prompt shared by every page of a document. Kept at module scope so
+# the text prefix is byte-identical across pages. Prefilled-KV reuse for this prefix
+# is not wired in: Qwen2-VL's generate() drops pixel_values and reuses stale M-RoPE
+# deltas whenever the cache is non-empty, so a cached prefix would silently lose the image.
+MARKDOWN_PROMPT = """
     You are a medical transcriptionist. Your task is to transcribe the medical record from the image into markdown format. The medical record may be in a tabular format, an image, a text document, or something similar, or a combination of these.
     
     IMPORTANT: Clearly distinguish between the PATIENT (the person being tested/treated) and any REFERRING PHYSICIAN or DOCTOR who signed the document.
@@ -161,6 +168,30 @@ def extract_medical_data(image_path: str, user_id: int = None) -> dict:
     Remember: Output PLAIN MARKDOWN only, NO HTML tags like <h5>, <span>, <hr>, etc. If a table is found, output it as a markdown table to show structure.
     """
 
+# Knowledge Base root (per-user subdirectories live under it)
+KB_BASE = Path(os.getenv("AEGIS_KB_DIR", "d:\\Aegis\\knowledge_base"))
+
+@lru_cache(maxsize=256)
+def _ensure_user_dir(user_id) -> Path:
+    """Returns the user's KB directory, creating it on first use only."""
+    kb_dir = KB_BASE / (f"user_{user_id}" if user_id else "anonymous")
+    kb_dir.mkdir(parents=True, exist_ok=True)
+    return kb_dir
+
+def strip_html_tags(text: str) -> str:
+    """Remove HTML tags from text, leaving only the content."""
+    # Remove HTML tags but keep the text content
+    clean = re.sub(r'<[^>]+>', '', text)
+    # Remove excessive whitespace
+    clean = re.sub(r'\n\s*\n\s*\n+', '\n\n', clean)
+    return clean.strip()
+
+def extract_medical_data(image_path: str, user_id: int = None) -> dict:
+    """
+    Extracts medical data from the given image path using the Vision Agent.
+    Supports PDF files by converting ALL pages to images and performing OCR.
+    Returns a dict with markdown-formatted text (better for LLM reasoning).
+    """
     content_to_save = ""
     page_count = 0
 
@@ -178,7 +209,7 @@ def extract_medical_data(image_path: str, user_id: int = None) -> dict:
                 img_data = pix.tobytes("png")
                 
                 # OCR with Markdown output
-                page_md = ingestor.analyze_image(img_data, markdown_prompt)
+                page_md = ingestor.analyze_image(img_data, MARKDOWN_PROMPT)
                 # Clean HTML if present
                 page_md = strip_html_tags(page_md)
                 
@@ -191,7 +222,7 @@ def extract_medical_data(image_path: str, user_id: int = None) -> dict:
             page_count = len(doc)
         else: # Fallback for single images
             print("Processing single image...")
-            md = ingestor.analyze_image(image_path, markdown_prompt)
+            md = ingestor.analyze_image(image_path, MARKDOWN_PROMPT)
             # Clean HTML if present
             md = strip_html_tags(md)
             
@@ -211,27 +242,17 @@ def extract_medical_data(image_path: str, user_id: int = None) -> dict:
         return {"error": str(e)}
 
     # Save to Knowledge Base (user-specific directory)
-    kb_base = "d:\\Aegis\\knowledge_base"
-    
-    # Create user-specific subdirectory
-    if user_id:
-        kb_dir = os.path.join(kb_base, f"user_{user_id}")
-    else:
-        kb_dir = os.path.join(kb_base, "anonymous")
-    
     timestamp = int(time.time())
     filename = f"{timestamp}_medical_record.md"
-    filepath = os.path.join(kb_dir, filename)
     
     try:
-        # Ensure the directory exists
-        os.makedirs(kb_dir, exist_ok=True)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content_to_save)
+        filepath = _ensure_user_dir(user_id) / filename
+        filepath.write_text(content_to_save, encoding="utf-8")
+        filepath = str(filepath)
         print(f"[INGESTOR] Saved record to Knowledge Base: {filepath}")
     except Exception as e:
         print(f"[INGESTOR ERROR] Failed to save to KB: {e}")
+        _ensure_user_dir.cache_clear()  # Directory may have been removed; re-check next time
         filepath = None  # Indicate failure to save
 
     return {
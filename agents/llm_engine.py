@@ -1,26 +1,53 @@
 import os
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+from functools import lru_cache
+import importlib.util
+from typing import Iterator, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Try to use Gemini API if available, otherwise fall back to local model
+# Try to use Gemini API if available, otherwise fall back to local model.
+# Backends are imported lazily on first use so importing this module stays cheap.
 USE_GEMINI = os.getenv("GOOGLE_API_KEY") is not None
 
 if USE_GEMINI:
-    import google.generativeai as genai
-    
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
     print("Using Gemini API for medical analysis")
 else:
-    try:
-        from llama_cpp import Llama
-        print("Using local Qwen2.5-7B model")
-    except ImportError:
-        print("Warning: llama_cpp not found. Local LLM will not work.")
-        Llama = None
-    
-    MODEL_PATH = "agents\\models\\qwen2.5-7b-instruct-q8_0-00001-of-00003.gguf"
+    print("Using local Qwen2.5-7B model")
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+def get_model_id() -> str:
+    """Identifies the active backend, e.g. for keying cached responses."""
+    if USE_GEMINI:
+        return GEMINI_MODEL
+    from agents._llama_singleton import MODEL_PATH
+    return os.path.basename(MODEL_PATH)
+
+PLACEHOLDER_RESPONSE = "Error: No LLM backend configured. Set GOOGLE_API_KEY or install llama-cpp-python."
+GEMINI_ERROR_RESPONSE = "Error: Unable to generate response from Gemini API."
+# Text returned in place of a real answer; callers must not cache output containing these
+LLM_ERROR_RESPONSES = (PLACEHOLDER_RESPONSE, GEMINI_ERROR_RESPONSE)
+
+_genai = None
+
+def _get_genai():
+    """Imports and configures google.generativeai on first use."""
+    global _genai
+    if _genai is None:
+        genai = importlib.import_module("google.generativeai")
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        _genai = genai
+    return _genai
+
+def _local_backend_available() -> bool:
+    return importlib.util.find_spec("llama_cpp") is not None
 
 class MedicalLLM:
     _instance = None
@@ -28,62 +55,172 @@ class MedicalLLM:
     @classmethod
     def get_instance(cls):
         if cls._instance is None and not USE_GEMINI:
-            if Llama is None:
-                raise ImportError("llama_cpp not installed")
-            print("Loading Qwen2.5-7B on GPU... this might take a minute.")
-            cls._instance = Llama(
-                model_path=MODEL_PATH,
-                n_ctx=8192,              # Increased context window
-                n_threads=8,             # More threads for CPU offload
-                n_gpu_layers=-1,         # Offload ALL layers to GPU
-                n_batch=512,             # Larger batch for GPU
-                use_mlock=True,          # Lock model in RAM to prevent swapping
-                use_mmap=True,           # Memory-map the model file
-                verbose=True,            # Show what device is being used
-            )
-            print("Qwen2.5-7B Loaded on GPU.")
+            # Shared with QwenChatModel so the GGUF is only loaded into VRAM once
+            from agents._llama_singleton import get_llama
+            cls._instance = get_llama()
         return cls._instance
 
-def generate_medical_response(prompt: str, max_tokens=512, temperature=0.1):
+@lru_cache(maxsize=8)
+def _json_grammar(schema_json: str):
+    """Compiles a JSON schema into a llama.cpp grammar (slow, so cached per schema)."""
+    from llama_cpp import LlamaGrammar
+    return LlamaGrammar.from_json_schema(schema_json, verbose=False)
+
+def _with_memory(prompt: str, memory: Optional[List[str]]) -> str:
+    """Prepends recalled memory snippets to the prompt."""
+    if not memory:
+        return prompt
+    memory_text = "\n".join(f"- {m}" for m in memory)
+    return f"RELEVANT MEMORY:\n{memory_text}\n\n{prompt}"
+
+def generate_medical_response_stream(
+    prompt: str,
+    max_tokens=512,
+    temperature=0.1,
+    memory: Optional[List[str]] = None,
+    response_schema: Optional[dict] = None
+) -> Iterator[str]:
+    """
+    Yields response text chunks as the backend produces them.
+    Lets the UI render the first tokens without waiting for the full completion.
+    With response_schema set, decoding is constrained to JSON (Gemini JSON mode,
+    llama.cpp grammar generated from the schema).
+    """
+    prompt = _with_memory(prompt, memory)
+    
     if USE_GEMINI:
         # Use Gemini API
+        emitted = False
         try:
-            model = genai.GenerativeModel('gemini-2.0-flash')
+            genai = _get_genai()
+            model = genai.GenerativeModel(GEMINI_MODEL)
             response = model.generate_content(
                 prompt,
                 generation_config=genai.types.GenerationConfig(
                     max_output_tokens=max_tokens,
                     temperature=temperature,
-                )
+                    response_mime_type="application/json" if response_schema else None,
+                ),
+                stream=True
             )
-            result = response.text.strip()
-            
-            print(f"[DEBUG LLM] Gemini response length: {len(result)} chars")
-            print(f"[DEBUG LLM] Response preview (first 300 chars): {result[:300]}")
-            
-            return result
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. safety metadata only)
+                    continue
+                if text:
+                    emitted = True
+                    yield text
         except Exception as e:
             print(f"[ERROR] Gemini API failed: {e}")
-            return "Error: Unable to generate response from Gemini API."
-    else:
-        # Use local Meditron model
+            if not emitted:
+                yield GEMINI_ERROR_RESPONSE
+    elif _local_backend_available():
+        # Use local Qwen model
         llm = MedicalLLM.get_instance()
-        output = llm(
+        grammar = _json_grammar(json.dumps(response_schema)) if response_schema else None
+        for output in llm(
             prompt,
             max_tokens=max_tokens,
             stop=["</s>", "\n\n\n\n", "</system>", "INSTRUCTIONS:"],
             echo=False,
             temperature=temperature,
             top_p=1.0,
-            repeat_penalty=1.1
-        )
-        result = output['choices'][0]['text'].strip()
-        
-        print(f"[DEBUG LLM] Raw response length: {len(result)} chars")
-        print(f"[DEBUG LLM] Raw response preview (first 300 chars): {result[:300]}")
-        print(f"[DEBUG LLM] Raw response preview (last 300 chars): {result[-300:]}")
-        
-        return result
+            repeat_penalty=1.1,
+            grammar=grammar,
+            stream=True
+        ):
+            yield output['choices'][0]['text']
+    else:
+        # No backend configured - cheap placeholder instead of failing the caller
+        print("[WARNING] llama_cpp not found and no GOOGLE_API_KEY set. Local LLM will not work.")
+        yield PLACEHOLDER_RESPONSE
+
+def generate_medical_response(
+    prompt: str,
+    max_tokens=512,
+    temperature=0.1,
+    memory: Optional[List[str]] = None,
+    response_schema: Optional[dict] = None
+):
+    result = "".join(generate_medical_response_stream(
+        prompt, max_tokens, temperature, memory, response_schema
+    )).strip()
+    
+    print(f"[DEBUG LLM] Response length: {len(result)} chars")
+    print(f"[DEBUG LLM] Response preview (first 300 chars): {result[:300]}")
+    print(f"[DEBUG LLM] Response preview (last 300 chars): {result[-300:]}")
+    
+    return result
+
+LLM_BATCH_SIZE = int(os.getenv("AEGIS_LLM_BATCH_SIZE", "20"))
+
+# Shared worker pool for concurrent Gemini requests; created on first batch
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_BATCH_SIZE, thread_name_prefix="llm")
+    return _executor
+
+def generate_medical_response_batch(
+    prompts: List[str],
+    max_tokens=512,
+    temperature=0.1,
+    response_schema: Optional[dict] = None,
+    batch_size: int = LLM_BATCH_SIZE
+) -> List[str]:
+    """
+    Runs several prompts and returns the responses in the same order.
+    Gemini requests are issued concurrently, batch_size at a time; the local
+    model has a single context, so prompts are decoded back to back.
+    """
+    if not USE_GEMINI:
+        return [
+            generate_medical_response(p, max_tokens, temperature, response_schema=response_schema)
+            for p in prompts
+        ]
+
+    def run(prompt):
+        return generate_medical_response(prompt, max_tokens, temperature, response_schema=response_schema)
+
+    pool = _get_executor()
+    results: List[str] = []
+    for start in range(0, len(prompts), batch_size):
+        results.extend(pool.map(run, prompts[start:start + batch_size]))
+    return results
+
+async def generate_medical_response_async(
+    prompt: str,
+    max_tokens=512,
+    temperature=0.1,
+    memory: Optional[List[str]] = None
+) -> str:
+    """
+    Awaitable generate_medical_response. Gemini uses its native async client;
+    the local model runs in a worker thread so the event loop stays free.
+    """
+    if USE_GEMINI:
+        try:
+            genai = _get_genai()
+            model = genai.GenerativeModel(GEMINI_MODEL)
+            response = await model.generate_content_async(
+                _with_memory(prompt, memory),
+                generation_config=genai.types.GenerationConfig(
+                    max_output_tokens=max_tokens,
+                    temperature=temperature,
+                )
+            )
+            return response.text.strip()
+        except Exception as e:
+            print(f"[ERROR] Gemini API failed: {e}")
+            return GEMINI_ERROR_RESPONSE
+    return await asyncio.to_thread(generate_medical_response, prompt, max_tokens, temperature, memory)
 
 def analyze_medical_image(image_data: bytes, prompt: str = "Analyze this medical image.") -> str:
     """
@@ -93,7 +230,8 @@ def analyze_medical_image(image_data: bytes, prompt: str = "Analyze this medical
         return "Error: Vision analysis requires Gemini API key."
         
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        genai = _get_genai()
+        model = genai.GenerativeModel(GEMINI_MODEL)
         
         # Create image part
         image_part = {
@@ -9,6 +9,7 @@ Privacy-First: Runs entirely locally, no data leaves the system.
 
 import os
 import json
+import functools
 from typing import Any, Dict, List, Optional, Iterator, Union, Mapping
 from pydantic import Field
 
@@ -25,11 +26,79 @@ from langchain_core.outputs import ChatResult, ChatGeneration
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
 from langchain_core.tools import BaseTool
 
-# Model path
-MODEL_PATH = os.getenv(
-    "QWEN_MODEL_PATH",
-    "agents/models/qwen2.5-7b-instruct-q8_0-00001-of-00003.gguf"
-)
+from agents._llama_singleton import MODEL_PATH, DEFAULT_N_CTX, get_llama
+
+
+@functools.lru_cache(maxsize=None)
+def _tool_schema(args_schema: type) -> str:
+    """Render a tool's parameter schema once per args_schema class."""
+    schema = args_schema.schema()
+    if 'properties' not in schema:
+        return ""
+    return json.dumps(schema['properties'], indent=2)
+
+
+def _find_json_blocks(text: str) -> List[str]:
+    """
+    Extract JSON objects from ```/```json fenced blocks in a single pass.
+    
+    Tracks brace depth (ignoring braces inside quoted strings) so nested
+    objects are returned whole, without regex backtracking on long outputs.
+    """
+    blocks = []
+    n = len(text)
+    i = text.find("```")
+    
+    while i != -1:
+        j = i + 3
+        # Optional language tag, then whitespace
+        if text.startswith("json", j):
+            j += 4
+        while j < n and text[j].isspace():
+            j += 1
+        
+        if j >= n or text[j] != "{":
+            i = text.find("```", j)
+            continue
+        
+        start = j
+        depth = 0
+        in_string = False
+        escaped = False
+        end = -1
+        while j < n:
+            ch = text[j]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    end = j + 1
+                    break
+            elif ch == "`":
+                # Hit a fence before the object closed - malformed block
+                break
+            j += 1
+        
+        if end == -1:
+            i = text.find("```", j)
+            continue
+        
+        blocks.append(text[start:end])
+        # Skip past the closing fence of this block
+        close = text.find("```", end)
+        i = text.find("```", close + 3) if close != -1 else -1
+    
+    return blocks
 
 
 class QwenChatModel(BaseChatModel):
@@ -49,13 +118,14 @@ class QwenChatModel(BaseChatModel):
     """
     
     model_path: str = Field(default=MODEL_PATH)
-    n_ctx: int = Field(default=8192, description="Context window size")
+    n_ctx: int = Field(default=DEFAULT_N_CTX, description="Context window size")
     n_gpu_layers: int = Field(default=-1, description="GPU layers (-1 for all)")
     temperature: float = Field(default=0.1)
     max_tokens: int = Field(default=1024)
     
     _llm: Any = None
     _tools: List[BaseTool] = []
+    _tools_prompt_cache: str = ""
     
     class Config:
         arbitrary_types_allowed = True
@@ -65,25 +135,13 @@ class QwenChatModel(BaseChatModel):
         self._load_model()
     
     def _load_model(self):
-        """Load the Qwen model via llama.cpp"""
+        """Load (or reuse) the shared Qwen model via llama.cpp"""
         if self._llm is not None:
             return
             
         try:
-            from llama_cpp import Llama
-            
-            print(f"[QWEN] Loading model from {self.model_path}...")
-            self._llm = Llama(
-                model_path=self.model_path,
-                n_ctx=self.n_ctx,
-                n_threads=8,
-                n_gpu_layers=self.n_gpu_layers,
-                n_batch=512,
-                use_mlock=True,
-                use_mmap=True,
-                verbose=False
-            )
-            print("[QWEN] Model loaded successfully")
+            # Shared with MedicalLLM so the GGUF is only loaded into VRAM once
+            self._llm = get_llama(self.model_path, self.n_ctx, self.n_gpu_layers)
             
         except ImportError:
             print("[QWEN] WARNING: llama_cpp not installed. Using mock responses.")
@@ -118,6 +176,8 @@ class QwenChatModel(BaseChatModel):
         )
         new_model._llm = self._llm
         new_model._tools = tools
+        # Tools are fixed for the lifetime of the bound model, so build the prompt once
+        new_model._tools_prompt_cache = new_model._format_tools_prompt()
         return new_model
     
     def _format_messages(self, messages: List[BaseMessage]) -> str:
@@ -132,40 +192,43 @@ class QwenChatModel(BaseChatModel):
         <|im_start|>assistant
         {assistant_message}<|im_end|>
         """
-        formatted = ""
+        parts = []
         
         for msg in messages:
             if isinstance(msg, SystemMessage):
-                formatted += f"<|im_start|>system\n{msg.content}<|im_end|>\n"
+                role = "system"
             elif isinstance(msg, HumanMessage):
-                formatted += f"<|im_start|>user\n{msg.content}<|im_end|>\n"
+                role = "user"
             elif isinstance(msg, AIMessage):
-                formatted += f"<|im_start|>assistant\n{msg.content}<|im_end|>\n"
+                role = "assistant"
             elif isinstance(msg, ToolMessage):
-                formatted += f"<|im_start|>tool\n{msg.content}<|im_end|>\n"
+                role = "tool"
+            else:
+                continue
+            parts.append(f"<|im_start|>{role}\n{msg.content}<|im_end|>\n")
         
         # Add assistant prompt for generation
-        formatted += "<|im_start|>assistant\n"
+        parts.append("<|im_start|>assistant\n")
         
-        return formatted
+        return "".join(parts)
     
     def _format_tools_prompt(self) -> str:
         """Generate tools description for the prompt."""
         if not self._tools:
             return ""
         
-        tools_desc = "\n\nYou have access to the following tools:\n\n"
+        parts = ["\n\nYou have access to the following tools:\n\n"]
         
         for tool in self._tools:
-            tools_desc += f"- {tool.name}: {tool.description}\n"
+            parts.append(f"- {tool.name}: {tool.description}\n")
             
             # Add input schema if available
             if hasattr(tool, 'args_schema') and tool.args_schema:
-                schema = tool.args_schema.schema()
-                if 'properties' in schema:
-                    tools_desc += f"  Parameters: {json.dumps(schema['properties'], indent=2)}\n"
+                params = _tool_schema(tool.args_schema)
+                if params:
+                    parts.append(f"  Parameters: {params}\n")
         
-        tools_desc += """
+        parts.append("""
 To use a tool, respond with a JSON block:
 ```json
 {
@@ -175,19 +238,27 @@ To use a tool, respond with a JSON block:
 ```
 
 If you don't need to use a tool, just respond normally.
-"""
-        return tools_desc
+""")
+        return "".join(parts)
+    
+    def _inject_tools_prompt(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Insert the cached tools description into the first system message or create one."""
+        tools_prompt = self._tools_prompt_cache or self._format_tools_prompt()
+        has_system = any(isinstance(m, SystemMessage) for m in messages)
+        
+        if has_system:
+            return [
+                SystemMessage(content=m.content + tools_prompt) if isinstance(m, SystemMessage) else m
+                for m in messages
+            ]
+        return [SystemMessage(content=tools_prompt)] + list(messages)
     
     def _parse_tool_calls(self, response: str) -> List[Dict[str, Any]]:
         """Parse tool calls from the response."""
         tool_calls = []
         
         # Look for JSON tool calls
-        import re
-        json_pattern = r'```(?:json)?\s*(\{[^`]+\})\s*```'
-        matches = re.findall(json_pattern, response, re.DOTALL)
-        
-        for match in matches:
+        for match in _find_json_blocks(response):
             try:
                 parsed = json.loads(match)
                 if 'tool' in parsed and 'tool_input' in parsed:
@@ -212,17 +283,7 @@ If you don't need to use a tool, just respond normally.
         
         # Add tools to system message if bound
         if self._tools:
-            # Insert tools description into first system message or create one
-            tools_prompt = self._format_tools_prompt()
-            has_system = any(isinstance(m, SystemMessage) for m in messages)
-            
-            if has_system:
-                messages = [
-                    SystemMessage(content=m.content + tools_prompt) if isinstance(m, SystemMessage) else m
-                    for m in messages
-                ]
-            else:
-                messages = [SystemMessage(content=tools_prompt)] + list(messages)
+            messages = self._inject_tools_prompt(messages)
         
         prompt = self._format_messages(messages)
         
@@ -272,16 +333,7 @@ If you don't need to use a tool, just respond normally.
         """Stream tokens from the model."""
         
         if self._tools:
-            tools_prompt = self._format_tools_prompt()
-            has_system = any(isinstance(m, SystemMessage) for m in messages)
-            
-            if has_system:
-                messages = [
-                    SystemMessage(content=m.content + tools_prompt) if isinstance(m, SystemMessage) else m
-                    for m in messages
-                ]
-            else:
-                messages = [SystemMessage(content=tools_prompt)] + list(messages)
+            messages = self._inject_tools_prompt(messages)
         
         prompt = self._format_messages(messages)
         
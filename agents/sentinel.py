@@ -1,9 +1,118 @@
 from agents.graph import app
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 import json
-from ml.lstm_model import predict_risk
-import numpy as np
-from agents.llm_engine import generate_medical_response
+import time
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from pydantic import ValidationError
+# Vitals risk scoring lives in ml/risk.py; re-exported for existing importers
+from ml.risk import (
+    assess_risk_from_vitals, compute_risk_from_vitals_window, materialize_vitals_by_stay
+)
+from agents.llm_engine import (
+    LLM_ERROR_RESPONSES, generate_medical_response,
+    generate_medical_response_batch, get_model_id
+)
+from cache_utils import cached_llm, make_key, cache_get, cache_set
+from schemas import ExtractedRecord
+
+ETL_PROMPT_VERSION = "etl-v2"
+ANALYSIS_PROMPT_VERSION = "analyze-v2"
+ETL_MAX_RETRIES = 2
+ETL_SCHEMA = ExtractedRecord.model_json_schema()
+
+def _parse_etl_response(response: str) -> dict:
+    return ExtractedRecord.model_validate_json(response).model_dump()
+
+@cached_llm(version=ETL_PROMPT_VERSION, model_id=get_model_id, validate=_parse_etl_response)
+def _generate_etl_response(prompt: str, max_tokens: int = 8192) -> str:
+    return generate_medical_response(prompt, max_tokens=max_tokens, response_schema=ETL_SCHEMA)
+
+def _build_etl_prompt(text: str) -> str:
+    return f"""
+        You are a Medical ETL (Extract, Transform, Load) Agent.
+        
+        TASK: Extract structured medical data from the following text.
+        
+        TEXT:
+        {text}
+        
+        OUTPUT FORMAT (JSON ONLY):
+        {{
+            "medications": [
+                {{"name": "drug name", "dosage": "e.g. 500mg", "frequency": "e.g. daily", "status": "Active"}}
+            ],
+            "conditions": [
+                {{"name": "diagnosis", "diagnosis_date": "YYYY-MM-DD or Unknown", "status": "Active/Chronic/Resolved"}}
+            ],
+            "allergies": [
+                {{"allergen": "substance", "reaction": "reaction description", "severity": "Mild/Moderate/Severe"}}
+            ],
+            "lab_results": [
+                {{"test_name": "e.g. Glucose", "value": "105", "unit": "mg/dL", "reference_range": "70-100", "date": "YYYY-MM-DD"}}
+            ],
+            "medical_notes": [
+                {{"date": "YYYY-MM-DD", "provider": "Dr. Name", "note_text": "Full text or key excerpt", "summary": "Brief summary of the visit/note"}}
+            ]
+        }}
+        
+        RULES:
+        1. Only extract EXPLICITLY mentioned items.
+        2. If a field is missing, use null or "Unknown".
+        3. Return ONLY valid JSON. No markdown formatting.
+        """
+
+def _record_to_str(extracted_data) -> str:
+    # Compact JSON: indentation only costs prompt tokens, the model doesn't need it
+    if isinstance(extracted_data, dict):
+        if orjson is not None:
+            return orjson.dumps(extracted_data, default=str).decode()
+        return json.dumps(extracted_data, separators=(",", ":"), ensure_ascii=False, default=str)
+    return str(extracted_data)
+
+def _analysis_cache_key(medical_record_str: str, user_context: str) -> str:
+    return make_key(
+        get_model_id(), ANALYSIS_PROMPT_VERSION,
+        f"{medical_record_str}\x00{user_context}", 0
+    )
+
+def _validate_analysis(output: str) -> str:
+    """
+    Rejects analyses that must not be cached: empty output, or output carrying the
+    LLM placeholder / API error text the graph passes through as an ordinary reply.
+    """
+    if not output or not output.strip():
+        raise ValueError("empty analysis")
+    for marker in LLM_ERROR_RESPONSES:
+        if marker in output:
+            raise ValueError(f"analysis contains LLM error text: {marker[:40]}")
+    return output
+
+def _cache_analysis(key: str, output: str):
+    try:
+        _validate_analysis(output)
+    except ValueError as e:
+        print(f"[SENTINEL] Not caching analysis: {e}")
+        return
+    cache_set(key, output, ANALYSIS_PROMPT_VERSION)
+
+def _format_graph_output(messages) -> str:
+    """Renders graph messages for the frontend, tool results as [System] blocks."""
+    final_output = ""
+    for msg in messages:
+        if isinstance(msg, AIMessage):
+            final_output += f"{msg.content}\n\n"
+        elif isinstance(msg, SystemMessage):
+            # Format tool results as [System] blocks for frontend parsing
+            if "Tool Result" in msg.content:
+                content = msg.content
+                if "Physician" in content:
+                    final_output += f"**[System] Physician Discovery:** {content}\n\n"
+                else:
+                    final_output += f"**[System] Tool Result:** {content}\n\n"
+    return final_output.strip()
 
 class SentinelAgent:
     
@@ -14,10 +123,13 @@ class SentinelAgent:
         print("[SENTINEL] Starting analysis via LangGraph...")
         
         # Convert extracted data to string format
-        if isinstance(extracted_data, dict):
-            medical_record_str = json.dumps(extracted_data, indent=2)
-        else:
-            medical_record_str = str(extracted_data)
+        medical_record_str = _record_to_str(extracted_data)
+
+        cache_key = _analysis_cache_key(medical_record_str, user_context)
+        cached = cache_get(cache_key, _validate_analysis)
+        if cached is not None:
+            print("[SENTINEL] Returning cached analysis.")
+            return cached
             
         # Initialize State
         initial_state = {
@@ -30,24 +142,10 @@ class SentinelAgent:
         # Run Graph
         try:
             final_state = app.invoke(initial_state)
-            messages = final_state['messages']
-            
             # Format Output for Frontend
-            final_output = ""
-            
-            for msg in messages:
-                if isinstance(msg, AIMessage):
-                    final_output += f"{msg.content}\n\n"
-                elif isinstance(msg, SystemMessage):
-                    # Format tool results as [System] blocks for frontend parsing
-                    if "Tool Result" in msg.content:
-                        content = msg.content
-                        if "Physician" in content:
-                            final_output += f"**[System] Physician Discovery:** {content}\n\n"
-                        else:
-                            final_output += f"**[System] Tool Result:** {content}\n\n"
-                            
-            return final_output.strip()
+            final_output = _format_graph_output(final_state['messages'])
+            _cache_analysis(cache_key, final_output)
+            return final_output
             
         except Exception as e:
             print(f"[SENTINEL ERROR] Graph execution failed: {e}")
@@ -60,50 +158,109 @@ class SentinelAgent:
         """
         print("[SENTINEL] 🏗️ Extracting structured data from medical record...")
         
-        prompt = f"""
-        You are a Medical ETL (Extract, Transform, Load) Agent.
-        
-        TASK: Extract structured medical data from the following text.
-        
-        TEXT:
-        {text}
+        prompt = _build_etl_prompt(text)
         
-        OUTPUT FORMAT (JSON ONLY):
-        {{
-            "medications": [
-                {{"name": "drug name", "dosage": "e.g. 500mg", "frequency": "e.g. daily", "status": "Active"}}
-            ],
-            "conditions": [
-                {{"name": "diagnosis", "diagnosis_date": "YYYY-MM-DD or Unknown", "status": "Active/Chronic/Resolved"}}
-            ],
-            "allergies": [
-                {{"allergen": "substance", "reaction": "reaction description", "severity": "Mild/Moderate/Severe"}}
-            ],
-            "lab_results": [
-                {{"test_name": "e.g. Glucose", "value": "105", "unit": "mg/dL", "reference_range": "70-100", "date": "YYYY-MM-DD"}}
-            ],
-            "medical_notes": [
-                {{"date": "YYYY-MM-DD", "provider": "Dr. Name", "note_text": "Full text or key excerpt", "summary": "Brief summary of the visit/note"}}
-            ]
-        }}
-        
-        RULES:
-        1. Only extract EXPLICITLY mentioned items.
-        2. If a field is missing, use null or "Unknown".
-        3. Return ONLY valid JSON. No markdown formatting.
+        attempt_prompt = prompt
+        for attempt in range(ETL_MAX_RETRIES + 1):
+            try:
+                response = _generate_etl_response(attempt_prompt, max_tokens=8192)
+                data = _parse_etl_response(response)
+                print(f"[SENTINEL] Extracted: {len(data['medications'])} meds, {len(data['lab_results'])} labs.")
+                return data
+            except ValidationError as e:
+                if attempt == ETL_MAX_RETRIES:
+                    print(f"[SENTINEL ERROR] ETL output still invalid after {attempt + 1} attempts: {e}")
+                    return {}
+                print(f"[SENTINEL] ETL output invalid (attempt {attempt + 1}), retrying with feedback...")
+                # Feed the validation error back so the model corrects its own output
+                attempt_prompt = (
+                    f"{prompt}\n\nYour previous output had this error:\n{e}\n"
+                    "Fix it and return ONLY valid JSON matching the format above."
+                )
+                time.sleep(1.0 * (attempt + 1))
+            except Exception as e:
+                print(f"[SENTINEL ERROR] ETL failed: {e}")
+                return {}
+
+    def analyze_health_record_stream(self, extracted_data: dict, user_context: str = ""):
         """
-        
+        Streaming analyze_health_record: yields output text as the graph produces it.
+        Reasoning tokens arrive as they are generated, tool results when their node finishes.
+        """
+        print("[SENTINEL] Starting streamed analysis via LangGraph...")
+        medical_record_str = _record_to_str(extracted_data)
+
+        cache_key = _analysis_cache_key(medical_record_str, user_context)
+        cached = cache_get(cache_key, _validate_analysis)
+        if cached is not None:
+            print("[SENTINEL] Returning cached analysis.")
+            yield cached
+            return
+
+        initial_state = {
+            "messages": [],
+            "medical_record": medical_record_str,
+            "user_context": user_context,
+            "iterations": 0
+        }
+
+        messages = []
+        emitted = False
+        streamed = False  # tokens of the current reasoning turn were already sent
         try:
-            response = generate_medical_response(prompt, max_tokens=8192)
-            # Clean response (remove markdown code blocks if present)
-            clean_json = response.replace("```json", "").replace("```", "").strip()
-            import json
-            data = json.loads(clean_json)
-            print(f"[SENTINEL] Extracted: {len(data.get('medications', []))} meds, {len(data.get('lab_results', []))} labs.")
-            return data
+            for mode, payload in app.stream(initial_state, stream_mode=["custom", "updates"]):
+                if mode == "custom":
+                    if not streamed and emitted:
+                        yield "\n\n"
+                    streamed = emitted = True
+                    yield payload
+                    continue
+
+                for update in payload.values():
+                    for msg in (update or {}).get("messages", []):
+                        messages.append(msg)
+                        if streamed and isinstance(msg, AIMessage):
+                            continue
+                        block = _format_graph_output([msg])
+                        if block:
+                            yield ("\n\n" if emitted else "") + block
+                            emitted = True
+                streamed = False
+
+            _cache_analysis(cache_key, _format_graph_output(messages))
         except Exception as e:
-            print(f"[SENTINEL ERROR] ETL failed: {e}")
-            return {}
+            print(f"[SENTINEL ERROR] Graph execution failed: {e}")
+            yield f"Error during analysis: {e}"
+
+    def extract_structured_data_batch(self, texts: list) -> list:
+        """
+        Batched extract_structured_data for bulk ingest. Cache misses are sent in
+        one generate_medical_response_batch call; any response that fails
+        validation falls back to the single-record retry loop.
+        """
+        prompts = [_build_etl_prompt(t) for t in texts]
+        model_id = get_model_id()
+        keys = [make_key(model_id, ETL_PROMPT_VERSION, p, 8192) for p in prompts]
+        cached = [cache_get(k, _parse_etl_response) for k in keys]
+        pending = [i for i, c in enumerate(cached) if c is None]
+        print(f"[SENTINEL] Batch ETL: {len(texts) - len(pending)} cached, {len(pending)} to extract.")
+
+        responses = dict(zip(pending, generate_medical_response_batch(
+            [prompts[i] for i in pending], max_tokens=8192, response_schema=ETL_SCHEMA
+        )))
+
+        results = []
+        for i, text in enumerate(texts):
+            response = cached[i] if cached[i] is not None else responses[i]
+            try:
+                data = _parse_etl_response(response)
+            except ValidationError:
+                results.append(self.extract_structured_data(text))
+                continue
+            if cached[i] is None:
+                cache_set(keys[i], response, ETL_PROMPT_VERSION)
+            results.append(data)
+        return results
 
     def chat(self, query: str, history: list = [], user_context: str = "", user_id: int = None, user_location: dict = None):
         """
@@ -151,40 +308,3 @@ class SentinelAgent:
 
 # Singleton instance
 sentinel = SentinelAgent()
-
-def assess_risk_from_vitals(sequence):
-    risk = predict_risk(sequence)
-
-    if risk > 0.85:
-        return risk, "HIGH"
-    elif risk > 0.6:
-        return risk, "MEDIUM"
-    else:
-        return risk, "LOW"
-
-def compute_risk_from_vitals_window(vitals_df, max_steps=32):
-    """
-    vitals_df: pandas DataFrame with columns:
-      ['heartrate','resprate','o2sat','sbp','dbp','temperature']
-      for a single stay_id, sorted by time.
-    """
-    features = ["heartrate","resprate","o2sat","sbp","dbp","temperature"]
-    seq = vitals_df[features].values
-
-    # same padding/truncation as training
-    if len(seq) >= max_steps:
-        seq = seq[:max_steps]
-    else:
-        pad = np.zeros((max_steps - len(seq), len(features)))
-        seq = np.vstack([seq, pad])
-
-    risk = predict_risk(seq)
-
-    if risk > 0.85:
-        level = "HIGH"
-    elif risk > 0.6:
-        level = "MEDIUM"
-    else:
-        level = "LOW"
-
-    return risk, level
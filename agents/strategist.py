@@ -1,50 +1,64 @@
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy.orm import Session, sessionmaker
+from database import engine
 from models import User, DailySummary, HealthGoal, Condition, Medication
-from agents.llm_engine import generate_medical_response
-from datetime import datetime, timedelta
+from agents.llm_engine import generate_medical_response_async
+from datetime import date, datetime, timedelta
+import asyncio
 import json
+from typing import Optional
+
+# Separate sessions per fetch so they can run concurrently; expire_on_commit=False
+# keeps goal objects readable after commit without another SELECT.
+PlanSession = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+def _fetch_history_text(user_id: int, since: date) -> str:
+    with PlanSession() as session:
+        summaries = session.query(DailySummary).filter(
+            DailySummary.user_id == user_id,
+            DailySummary.date >= since
+        ).order_by(DailySummary.date.asc()).all()
+        history_text = "".join(f"- {s.date}: {s.summary} (Mood: {s.mood})\n" for s in summaries)
+    return history_text or "No recent daily summaries available."
+
+def _fetch_profile_text(user_id: int) -> str:
+    with PlanSession() as session:
+        conditions = session.query(Condition.name).filter(Condition.user_id == user_id).all()
+        meds = session.query(Medication.name).filter(Medication.user_id == user_id).all()
+    profile_text = "Conditions: " + ", ".join(c.name for c in conditions) + "\n"
+    profile_text += "Medications: " + ", ".join(m.name for m in meds)
+    return profile_text
+
+def _fetch_goals_text(user_id: int) -> str:
+    with PlanSession() as session:
+        goals = session.query(HealthGoal.description).filter(
+            HealthGoal.user_id == user_id,
+            HealthGoal.status == "active"
+        ).all()
+    return "\n".join(f"- {g.description}" for g in goals) if goals else "None"
 
 class StrategistAgent:
     def __init__(self):
         pass
 
-    def generate_plan(self, user_id: int) -> str:
+    async def generate_plan(self, user_id: int, session: Optional[Session] = None) -> str:
         """
         Analyzes the last 7 days of summaries and current profile to generate a health plan.
+        Pass a caller-owned session (e.g. a route's get_db session) to write goals inside
+        its transaction; without one the Strategist opens and commits its own.
         """
         print(f"[STRATEGIST] ♟️ Generating Health Plan for User {user_id}...")
         
-        session = SessionLocal()
+        owns_session = session is None
+        if owns_session:
+            session = PlanSession()
         try:
-            # 1. Fetch Recent Summaries (last 7 days)
-            seven_days_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-            summaries = session.query(DailySummary).filter(
-                DailySummary.user_id == user_id,
-                DailySummary.date >= seven_days_ago
-            ).order_by(DailySummary.date.asc()).all()
-            
-            history_text = ""
-            for s in summaries:
-                history_text += f"- {s.date}: {s.summary} (Mood: {s.mood})\n"
-                
-            if not history_text:
-                history_text = "No recent daily summaries available."
-
-            # 2. Fetch Patient Profile
-            conditions = session.query(Condition).filter(Condition.user_id == user_id).all()
-            meds = session.query(Medication).filter(Medication.user_id == user_id).all()
-            
-            profile_text = "Conditions: " + ", ".join([c.name for c in conditions]) + "\n"
-            profile_text += "Medications: " + ", ".join([m.name for m in meds])
-
-            # 3. Fetch Active Goals
-            goals = session.query(HealthGoal).filter(
-                HealthGoal.user_id == user_id,
-                HealthGoal.status == "active"
-            ).all()
-            
-            goals_text = "\n".join([f"- {g.description}" for g in goals]) if goals else "None"
+            # 1-3. Fetch recent summaries (last 7 days), profile and active goals concurrently
+            seven_days_ago = date.today() - timedelta(days=7)
+            history_text, profile_text, goals_text = await asyncio.gather(
+                asyncio.to_thread(_fetch_history_text, user_id, seven_days_ago),
+                asyncio.to_thread(_fetch_profile_text, user_id),
+                asyncio.to_thread(_fetch_goals_text, user_id),
+            )
 
             # 4. Generate Plan via LLM
             prompt = f"""
@@ -72,7 +86,7 @@ class StrategistAgent:
             }}
             """
             
-            response = generate_medical_response(prompt, max_tokens=512)
+            response = await generate_medical_response_async(prompt, max_tokens=512)
             
             try:
                 clean_response = response.replace("```json", "").replace("```", "").strip()
@@ -83,23 +97,35 @@ class StrategistAgent:
                 message = data.get("message", "")
                 
                 # 5. Save New Goals
-                for goal_desc in new_goals:
-                    # Check if similar goal exists to avoid duplicates (simple check)
-                    existing = session.query(HealthGoal).filter(
+                # One SELECT for existing active goals; duplicates are checked in memory
+                # on a case-insensitive description prefix
+                existing = {
+                    g.description[:10].lower()
+                    for g in session.query(HealthGoal.description).filter(
                         HealthGoal.user_id == user_id,
-                        HealthGoal.description.like(f"%{goal_desc[:10]}%") # Fuzzy match start
-                    ).first()
-                    
-                    if not existing:
-                        new_goal = HealthGoal(
+                        HealthGoal.status == "active"
+                    ).all()
+                    if g.description
+                }
+
+                new_objs = []
+                for goal_desc in new_goals:
+                    key = goal_desc[:10].lower()
+                    if key not in existing:
+                        existing.add(key)
+                        new_objs.append(HealthGoal(
                             user_id=user_id,
                             description=goal_desc,
                             status="active"
-                        )
-                        session.add(new_goal)
+                        ))
                         print(f"[STRATEGIST] Set new goal: {goal_desc}")
                 
-                session.commit()
+                session.bulk_save_objects(new_objs)
+                if owns_session:
+                    session.commit()
+                else:
+                    # The request-scoped session commits once when the request finishes
+                    session.flush()
                 
                 return f"**Analysis**: {analysis}\n\n**New Goals Set**:\n" + "\n".join([f"- {g}" for g in new_goals]) + f"\n\n**Message**: {message}"
                 
@@ -109,7 +135,8 @@ class StrategistAgent:
         except Exception as e:
             return f"Error generating plan: {e}"
         finally:
-            session.close()
+            if owns_session:
+                session.close()
 
     def award_habitica_xp(self, task_name: str, difficulty: str = "easy") -> str:
         """
@@ -0,0 +1,130 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+# Content-addressable cache for LLM responses.
+# Identical (model, prompt version, prompt, max_tokens) tuples map to the same key,
+# so re-analysing the same record skips the multi-second model call.
+CACHE_DIR = os.getenv("AEGIS_CACHE_DIR", "./.aegis_cache")
+CACHE_ENABLED = os.getenv("AEGIS_LLM_CACHE", "1") == "1"
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+
+class _FileCache:
+    """Minimal stand-in for diskcache.Cache: one JSON file per key."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str, default=None):
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return default
+
+    def set(self, key: str, value) -> bool:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(value), encoding="utf-8")
+        os.replace(tmp, path)
+        return True
+
+    def delete(self, key: str) -> bool:
+        try:
+            self._path(key).unlink()
+            return True
+        except OSError:
+            return False
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = diskcache.Cache(CACHE_DIR) if diskcache else _FileCache(CACHE_DIR)
+    return _cache
+
+
+def _len_prefix(part: bytes) -> bytes:
+    # Length-prefixing keeps ("ab", "c") and ("a", "bc") from hashing the same
+    return len(part).to_bytes(8, "big") + part
+
+def make_key(model_id: str, version: str, prompt: str, max_tokens: int) -> str:
+    parts = (model_id.encode(), version.encode(), prompt.encode("utf-8"), str(max_tokens).encode())
+    return hashlib.sha256(b"\x00".join(_len_prefix(p) for p in parts)).hexdigest()
+
+
+def cache_get(key: str, validate: Optional[Callable[[str], object]] = None) -> Optional[str]:
+    """Returns the cached response, evicting it if it no longer passes validation."""
+    if not CACHE_ENABLED:
+        return None
+    entry = get_cache().get(key)
+    if not entry:
+        return None
+    response = entry.get("response")
+    if validate is not None:
+        try:
+            validate(response)
+        except Exception as e:
+            print(f"[CACHE] Evicting invalid entry {key[:12]}: {e}")
+            get_cache().delete(key)
+            return None
+    return response
+
+def cache_set(key: str, response: str, version: str):
+    if not CACHE_ENABLED:
+        return
+    get_cache().set(key, {
+        "response": response,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+def cached_llm(version: str, model_id: Callable[[], str], validate: Optional[Callable[[str], object]] = None):
+    """
+    Decorator for `fn(prompt, max_tokens=...) -> str` LLM calls.
+    Fresh responses are only stored when they pass `validate`, which signals
+    rejection by raising ValueError (pydantic's ValidationError included).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(prompt: str, max_tokens: int = 512, **kwargs):
+            key = make_key(model_id(), version, prompt, max_tokens)
+            cached = cache_get(key, validate)
+            if cached is not None:
+                print(f"[CACHE] Hit for {version} ({key[:12]})")
+                return cached
+
+            response = fn(prompt, max_tokens=max_tokens, **kwargs)
+            if validate is not None:
+                try:
+                    validate(response)
+                except ValueError:
+                    # Invalid output is returned to the caller but never cached
+                    return response
+            try:
+                cache_set(key, response, version)
+            except Exception as e:
+                print(f"[CACHE] Failed to store {version} ({key[:12]}): {e}")
+            return response
+        return wrapper
+    return decorator
@@ -1,37 +1,79 @@
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import os
+import threading
 
 # Generate a key if it doesn't exist, otherwise load it
 # In production, this should be stored in a secure vault or env var
 KEY_FILE = "d:\\Aegis\\secret.key"
 
+# AES-256-GCM: single pass, AES-NI/CLMUL accelerated by OpenSSL.
+# Ciphertext layout: version byte | 12-byte nonce | ciphertext + tag
+AESGCM_VERSION = b"\x01"
+NONCE_SIZE = 12
+
 def load_key():
     if not os.path.exists(KEY_FILE):
-        key = Fernet.generate_key()
-        with open(KEY_FILE, "wb") as key_file:
-            key_file.write(key)
-        print(f"[CRYPTO] Generated new encryption key at {KEY_FILE}")
-    else:
-        with open(KEY_FILE, "rb") as key_file:
-            key = key_file.read()
-    return key
+        key = AESGCM.generate_key(bit_length=256)
+        # Write the key to a private temp file first and hard-link it into place:
+        # the link either publishes a complete, synced key or fails because another
+        # process already published one, so a reader never sees a partial file
+        tmp = f"{KEY_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "xb") as key_file:
+                key_file.write(key)
+                key_file.flush()
+                os.fsync(key_file.fileno())
+            os.link(tmp, KEY_FILE)
+            print(f"[CRYPTO] Generated new encryption key at {KEY_FILE}")
+            return key
+        except FileExistsError:
+            # Another process won the race; use its key instead
+            pass
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    with open(KEY_FILE, "rb") as key_file:
+        return key_file.read()
 
-# Singleton Cipher Suite
-_cipher_suite = None
+# Singleton ciphers
+_aead = None
+_legacy_fernet = None
+_cipher_lock = threading.Lock()
 
 def get_cipher_suite():
-    global _cipher_suite
-    if _cipher_suite is None:
-        key = load_key()
-        _cipher_suite = Fernet(key)
-    return _cipher_suite
+    global _aead, _legacy_fernet
+    if _aead is not None:
+        return _aead
+    with _cipher_lock:
+        if _aead is None:
+            key = load_key()
+            if len(key) == 32:
+                aes_key = key
+            else:
+                # Key file from the Fernet era: keep it for old data and derive the AES key from it
+                _legacy_fernet = Fernet(key)
+                aes_key = HKDF(
+                    algorithm=hashes.SHA256(), length=32, salt=None, info=b"aegis-aesgcm"
+                ).derive(key)
+            _aead = AESGCM(aes_key)
+    return _aead
 
 def encrypt_content(content: str) -> bytes:
     """Encrypts a string content."""
     cipher = get_cipher_suite()
-    return cipher.encrypt(content.encode('utf-8'))
+    nonce = os.urandom(NONCE_SIZE)
+    return AESGCM_VERSION + nonce + cipher.encrypt(nonce, content.encode('utf-8'), None)
 
 def decrypt_content(encrypted_content: bytes) -> str:
     """Decrypts bytes content back to string."""
     cipher = get_cipher_suite()
-    return cipher.decrypt(encrypted_content).decode('utf-8')
+    if encrypted_content[:1] != AESGCM_VERSION:
+        # Fernet tokens are base64 text, so they never start with the version byte
+        if _legacy_fernet is None:
+            raise ValueError("Unrecognised ciphertext format")
+        return _legacy_fernet.decrypt(encrypted_content).decode('utf-8')
+    nonce = encrypted_content[1:1 + NONCE_SIZE]
+    return cipher.decrypt(nonce, encrypted_content[1 + NONCE_SIZE:], None).decode('utf-8')
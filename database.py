@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 import os
 from dotenv import load_dotenv
 
@@ -11,10 +12,26 @@ load_dotenv()
 # Default to SQLite for local development if no DATABASE_URL is set
 database_url = os.getenv("DATABASE_URL", "sqlite:///./aegis.db")
 
-# SQLite requires specific connect_args
-connect_args = {"check_same_thread": False} if "sqlite" in database_url else {}
+if "sqlite" in database_url:
+    # SQLite requires specific connect_args
+    engine_kwargs = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" in database_url or database_url == "sqlite://":
+        # An in-memory DB only exists on its connection, so share a single one
+        engine_kwargs["poolclass"] = StaticPool
+else:
+    engine_kwargs = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "40")),
+        "pool_pre_ping": True,   # Drop connections killed by a Postgres restart
+        "pool_recycle": 1800,
+    }
+    if database_url.startswith("postgres"):
+        # Keep pathological queries from wedging workers
+        engine_kwargs["connect_args"] = {
+            "options": f"-c statement_timeout={os.getenv('DB_STATEMENT_TIMEOUT_MS', '5000')}"
+        }
 
-engine = create_engine(database_url, connect_args=connect_args)
+engine = create_engine(database_url, **engine_kwargs)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
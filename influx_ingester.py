@@ -12,11 +12,22 @@ When running with Docker, InfluxDB is automatically configured.
 """
 
 import influxdb_client
+from influxdb_client import WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
+import atexit
+import collections
+import functools
+import json
 import os
+import re
+import sys
+import threading
+import time
 from dotenv import load_dotenv
-import random
-from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import NamedTuple
 
 load_dotenv()
 
@@ -25,119 +36,312 @@ INFLUX_URL = os.getenv("INFLUX_URL", "http://localhost:8086")
 INFLUX_TOKEN = os.getenv("INFLUX_TOKEN", "")
 INFLUX_ORG = os.getenv("INFLUX_ORG", "aegis_org")
 INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "vitals")
+INFLUX_POOL_SIZE = int(os.getenv("INFLUX_POOL_SIZE", "50"))
+
+# Points are buffered in-process and flushed when either limit is hit, so a lone
+# reading reaches InfluxDB within ~250ms instead of waiting out a 5s batch interval.
+WRITE_BATCH_SIZE = int(os.getenv("INFLUX_WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("INFLUX_WRITE_FLUSH_INTERVAL", "0.25"))
+# Bounds memory if InfluxDB is unreachable; the oldest points are dropped first
+WRITE_BUFFER_MAX = int(os.getenv("INFLUX_WRITE_BUFFER_MAX", "100000"))
+# Backoff between retries of a failed write (doubles up to the max)
+WRITE_RETRY_BASE = 0.5
+WRITE_RETRY_MAX = 30.0
 
 # Use mock if no token provided or explicitly set
 MOCK_INFLUX = os.getenv("MOCK_INFLUX", "true").lower() == "true" or not INFLUX_TOKEN
 
+# Mock writes/queries are only printed when asked for; otherwise they go to a bounded log
+MOCK_INFLUX_VERBOSE = os.getenv("MOCK_INFLUX_VERBOSE") == "1"
+
+# Shared generator for mock readings; values for a whole query are drawn in one call
+_rng = np.random.default_rng()
+
+def _mock_times(n: int, step_minutes: int) -> list:
+    """n timestamps step_minutes apart, newest first, as naive UTC datetimes."""
+    # One clock read and one vectorised subtraction; datetimes are only built by tolist()
+    base = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), "us")
+    return (base - np.arange(n, dtype="int64") * np.timedelta64(step_minutes, "m")).tolist()
+
 class MockWriteApi:
-    def write(self, bucket, org, record):
-        print(f"[MockInflux] Writing to {bucket}: {record}")
+    __slots__ = ("log", "verbose")
+
+    def __init__(self):
+        self.verbose = MOCK_INFLUX_VERBOSE
+        self.log = collections.deque(maxlen=1024)
+
+    def write(self, bucket, org, record, **kwargs):
+        if self.verbose:
+            print(f"[MockInflux] Writing to {bucket}: {record}")
+        else:
+            self.log.append(record)
+
+    def append(self, line):
+        # Same interface as _WriteBuffer, used when a real client falls back to the mock
+        self.write(INFLUX_BUCKET, INFLUX_ORG, line)
 
 class MockQueryApi:
+    __slots__ = ("log", "verbose")
+
+    def __init__(self):
+        self.verbose = MOCK_INFLUX_VERBOSE
+        self.log = collections.deque(maxlen=1024)
+
     def query(self, query, org):
-        print(f"[MockInflux] Querying: {query}")
+        if self.verbose:
+            print(f"[MockInflux] Querying: {query}")
+        else:
+            self.log.append(query)
         # Return dummy data structure that mimics InfluxDB client response
         # We need to return an object that has a 'records' attribute which is a list of objects with get_time, get_field, get_value
+        times = _mock_times(10, 5)
+        hr = (60 + _rng.integers(0, 41, size=10)).tolist()
+        spo2 = (95 + _rng.integers(0, 5, size=10)).tolist()
         results = []
-        now = datetime.now()
-        for i in range(10):
-            t = now - timedelta(minutes=i*5)
-            results.append(MockRecord(t, "heart_rate", 60 + random.randint(0, 40)))
-            results.append(MockRecord(t, "spo2", 95 + random.randint(0, 4)))
+        for t, h, sp in zip(times, hr, spo2):
+            results.append(MockRecord(t, "heart_rate", h))
+            results.append(MockRecord(t, "spo2", sp))
         
         return [MockTable(results)]
 
-class MockRecord:
-    def __init__(self, time, field, value):
-        self._time = time
-        self._field = field
-        self._value = value
-    
+    def query_data_frame(self, query, org):
+        records = self.query(query, org)[0].records
+        return pd.DataFrame({
+            "_time": [r.get_time() for r in records],
+            "_field": [r.get_field() for r in records],
+            "_value": [r.get_value() for r in records],
+        })
+
+class MockRecord(NamedTuple):
+    # NamedTuple forbids leading underscores, so fields drop FluxRecord's "_" prefix
+    time: datetime
+    field: str
+    value: float
+
     def get_time(self):
-        return self._time
-    
+        return self.time
+
     def get_field(self):
-        return self._field
-    
+        return self.field
+
     def get_value(self):
-        return self._value
-
-class MockTable:
-    def __init__(self, records):
-        self.records = records
-
-if not MOCK_INFLUX and INFLUX_URL:
-    try:
-        client = influxdb_client.InfluxDBClient(
-            url=INFLUX_URL,
-            token=INFLUX_TOKEN,
-            org=INFLUX_ORG
-        )
-        write_api = client.write_api(write_options=SYNCHRONOUS)
-        query_api = client.query_api()
-    except Exception as e:
-        print(f"Failed to connect to InfluxDB: {e}. Falling back to Mock.")
-        write_api = MockWriteApi()
-        query_api = MockQueryApi()
-else:
-    print("Using Mock InfluxDB Client")
-    write_api = MockWriteApi()
-    query_api = MockQueryApi()
-
-def write_vitals(user_id: int, heart_rate: float, spo2: float):
+        return self.value
+
+class MockTable(NamedTuple):
+    records: list
+
+class _WriteBuffer:
+    """
+    Collects line-protocol strings and writes them in one request per batch
+    from a daemon thread, so request handlers never block on InfluxDB.
+    Failed writes are retried with exponential backoff; when the buffer is full the
+    oldest points are dropped (and counted in `dropped`) to make room for new ones.
+    """
+
+    def __init__(self, write_api, batch_size=WRITE_BATCH_SIZE, interval=WRITE_FLUSH_INTERVAL,
+                 max_points=WRITE_BUFFER_MAX):
+        self.write_api = write_api
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_points = max_points
+        self.q = collections.deque()
+        self.q_lock = threading.Lock()   # guards q/dropped; held only for in-memory ops
+        self.lock = threading.Lock()     # serialises flushes (held across the HTTP write)
+        self.last = time.monotonic()
+        self.dropped = 0
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self._thread = threading.Thread(target=self._drain, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def _trim(self):
+        # Called with q_lock held: drop the oldest points beyond max_points
+        overflow = len(self.q) - self.max_points
+        if overflow > 0:
+            for _ in range(overflow):
+                self.q.popleft()
+            before, self.dropped = self.dropped, self.dropped + overflow
+            # Report the first drop, then once per 1000 so an outage doesn't flood the log
+            if before == 0 or before // 1000 != self.dropped // 1000:
+                print(f"[INFLUX] Buffer full: dropping oldest points ({self.dropped} dropped so far)")
+
+    def append(self, line: str):
+        with self.q_lock:
+            self.q.append(line)
+            if len(self.q) > self.max_points:
+                self._trim()
+
+    def flush(self) -> bool:
+        """Write one batch; returns False if the write failed (the batch is requeued)."""
+        with self.lock:
+            self.last = time.monotonic()
+            with self.q_lock:
+                batch = [self.q.popleft() for _ in range(min(len(self.q), self.batch_size))]
+            if not batch:
+                return True
+            try:
+                self.write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=batch,
+                                     write_precision=WritePrecision.NS)
+            except Exception as e:
+                # Put the batch back in order ahead of newer points, then back off
+                self.backoff = min(self.backoff * 2, WRITE_RETRY_MAX) if self.backoff else WRITE_RETRY_BASE
+                self.retry_at = time.monotonic() + self.backoff
+                print(f"[INFLUX] Write of {len(batch)} points failed, retrying in {self.backoff:.1f}s: {e}")
+                with self.q_lock:
+                    self.q.extendleft(reversed(batch))
+                    self._trim()
+                return False
+            self.backoff = 0.0
+            return True
+
+    def close(self):
+        while self.q:
+            if not self.flush():
+                break
+
+    def _drain(self):
+        while True:
+            now = time.monotonic()
+            if now >= self.retry_at and (
+                len(self.q) >= self.batch_size or now - self.last > self.interval
+            ):
+                self.flush()
+            time.sleep(0.05)
+
+@functools.cache
+def _get_apis():
+    """
+    Builds the (write_api, query_api) pair on first use rather than at import,
+    so processes that never touch InfluxDB skip the client setup entirely.
+    """
+    if not MOCK_INFLUX and INFLUX_URL:
+        try:
+            # One shared client for the process; its urllib3 pool keeps connections alive
+            client = influxdb_client.InfluxDBClient(
+                url=INFLUX_URL,
+                token=INFLUX_TOKEN,
+                org=INFLUX_ORG,
+                enable_gzip=True,
+                timeout=30_000,
+                connection_pool_maxsize=INFLUX_POOL_SIZE
+            )
+            write_api = _WriteBuffer(client.write_api(write_options=SYNCHRONOUS))
+            query_api = client.query_api()
+            # Flush buffered points on shutdown (atexit runs LIFO: the buffer drains first)
+            atexit.register(client.close)
+            atexit.register(write_api.close)
+            return write_api, query_api
+        except Exception as e:
+            print(f"Failed to connect to InfluxDB: {e}. Falling back to Mock.")
+    else:
+        print("Using Mock InfluxDB Client")
+    return MockWriteApi(), MockQueryApi()
+
+def _get_write_api():
+    return _get_apis()[0]
+
+def _get_query_api():
+    return _get_apis()[1]
+
+_MEASUREMENT = "vitals"
+
+@functools.lru_cache(maxsize=4096)
+def _uid_str(user_id: int) -> str:
+    # One shared string per user instead of a fresh str(int) on every write
+    return sys.intern(str(user_id))
+
+def _mock_write_vitals(user_id: int, heart_rate: float, spo2: float):
+    _get_write_api().write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=f"user={user_id} hr={heart_rate} spo2={spo2}")
+
+def _influx_write_vitals(user_id: int, heart_rate: float, spo2: float):
     """
     Writes a new vital sign data point to InfluxDB tagged by user_id.
     """
-    if MOCK_INFLUX:
-        write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=f"user={user_id} hr={heart_rate} spo2={spo2}")
-        return
+    # Line protocol written directly: skips building and re-serialising a Point per sample.
+    # Fields are always floats so an int reading can't create a conflicting field type.
+    line = f"{_MEASUREMENT},user_id={_uid_str(user_id)} heart_rate={float(heart_rate)},spo2={float(spo2)} {time.time_ns()}"
+    _get_write_api().append(line)
 
-    point = (
-        influxdb_client.Point("vitals")
-        .tag("user_id", str(user_id))
-        .field("heart_rate", heart_rate)
-        .field("spo2", spo2)
+# MOCK_INFLUX is fixed at import, so pick the implementation once instead of branching per call
+write_vitals = _mock_write_vitals if MOCK_INFLUX else _influx_write_vitals
+
+# Constant query text with bound parameters: the server sees one query for every
+# user, and user-supplied values are never spliced into Flux source.
+# Flux query parameters (params=) are only supported by InfluxDB Cloud, so the
+# values are validated and rendered into a constant template instead.
+_TIME_RANGE_RE = re.compile(r"-?\d+(ns|us|ms|s|m|h|d|w|mo|y)")
+
+VITALS_FLUX = """
+    from(bucket: {bucket})
+    |> range(start: {time_range})
+    |> filter(fn: (r) => r._measurement == "%s")
+    |> filter(fn: (r) => r.user_id == "{user_id}")
+    |> keep(columns: ["_time", "_field", "_value"])
+    """ % _MEASUREMENT
+
+def validate_time_range(time_range: str) -> str:
+    """Returns time_range if it is a plain Flux duration such as "-1h", else raises ValueError."""
+    if not isinstance(time_range, str) or not _TIME_RANGE_RE.fullmatch(time_range):
+        raise ValueError(f"Invalid time range: {time_range!r}")
+    return time_range
+
+def _vitals_flux(user_id: int, time_range: str) -> str:
+    return VITALS_FLUX.format(
+        bucket=json.dumps(INFLUX_BUCKET),
+        time_range=validate_time_range(time_range),
+        user_id=_uid_str(int(user_id)),
     )
-    write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=point)
 
-def query_vitals(user_id: int, time_range: str = "-1h"):
+def _mock_query_vitals(user_id: int, time_range: str = "-1h"):
+    # Return mock data directly in the format expected by the API
+    times = _mock_times(20, 1)[::-1]
+    hr = (70 + _rng.integers(-5, 21, size=20)).tolist()
+    spo2 = (98 + _rng.integers(-2, 2, size=20)).tolist()
+    # Built oldest-first, so no sort is needed
+    results = []
+    for t, h, sp in zip(times, hr, spo2):
+        results.append({"time": t, "field": "heart_rate", "value": h})
+        results.append({"time": t, "field": "spo2", "value": sp})
+    return results
+
+def _influx_query_vitals(user_id: int, time_range: str = "-1h"):
     """
     Queries the last "time_range" of vitals data for the user with the given user_id
     """
-    if MOCK_INFLUX:
-        # Return mock data directly in the format expected by the API
-        results = []
-        now = datetime.now()
-        for i in range(20):
-            t = now - timedelta(minutes=i)
-            results.append({
-                "time": t,
-                "field": "heart_rate",
-                "value": 70 + random.randint(-5, 20)
-            })
-            results.append({
-                "time": t,
-                "field": "spo2",
-                "value": 98 + random.randint(-2, 1)
-            })
-        # Sort by time ascending
-        results.sort(key=lambda x: x["time"])
-        return results
-
-    flux_query = f"""
-    from(bucket: "{INFLUX_BUCKET}")
-    |> range(start: {time_range})
-    |> filter(fn: (r) => r._measurement == "vitals")
-    |> filter(fn: (r) => r.user_id == "{str(user_id)}")
+    df = query_vitals_df(user_id, time_range)
+    if df.empty:
+        return []
+    return df.to_dict("records")
+
+def _mock_query_vitals_df(user_id: int, time_range: str = "-1h") -> pd.DataFrame:
+    return pd.DataFrame(_mock_query_vitals(user_id, time_range), columns=["time", "field", "value"])
+
+def _influx_query_vitals_df(user_id: int, time_range: str = "-1h") -> pd.DataFrame:
+    """
+    Same data as query_vitals as a DataFrame with columns time/field/value,
+    parsed column-wise by the client instead of record by record.
     """
-    tables = query_api.query(query=flux_query, org=INFLUX_ORG)
+    df = _get_query_api().query_data_frame(query=_vitals_flux(user_id, time_range), org=INFLUX_ORG)
+    if isinstance(df, list):
+        df = pd.concat(df, copy=False) if df else pd.DataFrame()
+    if df.empty:
+        return pd.DataFrame(columns=["time", "field", "value"])
+    return df[["_time", "_field", "_value"]].rename(
+        columns={"_time": "time", "_field": "field", "_value": "value"}
+    )
 
-    results = []
-    for table in tables:
-        for record in table.records:
-            results.append({
-                "time" : record.get_time(),
-                "field" : record.get_field(),
-                "value" : record.get_value()
-            })
-    return results
\ No newline at end of file
+query_vitals = _mock_query_vitals if MOCK_INFLUX else _influx_query_vitals
+query_vitals_df = _mock_query_vitals_df if MOCK_INFLUX else _influx_query_vitals_df
+
+def query_vitals_stream(user_id: int, time_range: str = "-1h"):
+    """
+    Yields the same time/field/value dicts as query_vitals one record at a time
+    as the response is parsed, so large ranges are never held in memory at once.
+    """
+    query_api = _get_query_api()
+    if MOCK_INFLUX or not hasattr(query_api, "query_stream"):
+        yield from query_vitals(user_id, time_range)
+        return
+
+    for record in query_api.query_stream(query=_vitals_flux(user_id, time_range), org=INFLUX_ORG):
+        yield {"time": record.get_time(), "field": record.get_field(), "value": record.get_value()}
@@ -20,7 +20,9 @@ import os
 import json
 import pickle
 import asyncio
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Optional, Dict, List, Any
 
@@ -30,6 +32,8 @@ try:
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
     from googleapiclient.discovery import build
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
     GOOGLE_API_AVAILABLE = True
 except ImportError:
     GOOGLE_API_AVAILABLE = False
@@ -37,7 +41,11 @@ except ImportError:
     print("  pip install google-api-python-client google-auth-oauthlib")
 
 import sys
-sys.path.insert(0, str(Path(__file__).parent.parent))
+# Imported as integrations.<module> the project root is already importable; only
+# running this file directly as a script needs it added
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+from sqlalchemy import insert
 from database import SessionLocal
 from models import HealthEvent
 
@@ -63,8 +71,60 @@ DATA_TYPES = {
     'body_fat': 'com.google.body.fat.percentage',
 }
 
+# Fit timestamps are integer ns/ms since the epoch; convert with integer math so
+# nanosecond values never pass through a float
+NS_PER_S = 1_000_000_000
+NS_PER_US = 1_000
+MS_PER_S = 1_000
+
+# Caps how many GoogleFitSync loops in this process poll the Fit API at the same
+# time; each poll already fans out into three requests.
+SYNC_CONCURRENCY = int(os.getenv("GOOGLE_FIT_SYNC_CONCURRENCY", "2"))
+_sync_slots = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+# Access tokens are refreshed in the background this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+def _to_ns(dt: datetime) -> int:
+    return int(dt.timestamp()) * NS_PER_S + dt.microsecond * NS_PER_US
+
+def _to_ms(dt: datetime) -> int:
+    return int(dt.timestamp()) * MS_PER_S + dt.microsecond // 1_000
+
+def _from_ns(ns: int) -> datetime:
+    return datetime.fromtimestamp(ns // NS_PER_S) + timedelta(microseconds=(ns % NS_PER_S) // NS_PER_US)
+
+def _from_ms(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms // MS_PER_S) + timedelta(milliseconds=ms % MS_PER_S)
+
 CREDENTIALS_FILE = Path(__file__).parent / 'credentials.json'
-TOKEN_FILE = Path(__file__).parent / 'token.pickle'
+TOKEN_FILE = Path(__file__).parent / 'token.json'
+LEGACY_TOKEN_FILE = Path(__file__).parent / 'token.pickle'
+
+
+class CredsCache:
+    """Parsed OAuth credentials shared by every GoogleFitSync in the process."""
+    _creds = None
+
+    @classmethod
+    def get(cls):
+        if cls._creds is not None:
+            return cls._creds
+        if TOKEN_FILE.exists():
+            cls._creds = Credentials.from_authorized_user_info(
+                json.loads(TOKEN_FILE.read_text(encoding='utf-8')), SCOPES
+            )
+        elif LEGACY_TOKEN_FILE.exists():
+            # One-time migration of the old pickled token
+            with open(LEGACY_TOKEN_FILE, 'rb') as token:
+                cls._creds = pickle.load(token)
+            cls.save(cls._creds)
+        return cls._creds
+
+    @classmethod
+    def save(cls, creds):
+        TOKEN_FILE.write_text(creds.to_json(), encoding='utf-8')
+        cls._creds = creds
 
 
 class GoogleFitSync:
@@ -74,6 +134,17 @@ class GoogleFitSync:
         self.user_id = user_id
         self.service = None
         self.last_sync = None
+        self._creds = None
+        self._refresh_task = None
+        # httplib2 connections are not thread-safe: one keep-alive client per thread
+        self._http_local = threading.local()
+
+    def _http(self):
+        """Authorized HTTP client for the current thread, reused across API calls."""
+        http = getattr(self._http_local, "http", None)
+        if http is None:
+            http = self._http_local.http = AuthorizedHttp(self._creds, http=httplib2.Http(timeout=10))
+        return http
         
     def authenticate(self) -> bool:
         """Authenticate with Google Fit API."""
@@ -81,12 +152,8 @@ class GoogleFitSync:
             print("❌ Google API libraries not installed")
             return False
             
-        creds = None
-        
-        # Load existing token
-        if TOKEN_FILE.exists():
-            with open(TOKEN_FILE, 'rb') as token:
-                creds = pickle.load(token)
+        # Load existing token (parsed once per process)
+        creds = CredsCache.get()
         
         # Refresh or get new token
         if not creds or not creds.valid:
@@ -108,38 +175,60 @@ class GoogleFitSync:
                 creds = flow.run_local_server(port=8080)
             
             # Save token
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
+            CredsCache.save(creds)
         
-        self.service = build('fitness', 'v1', credentials=creds)
+        # The service only holds the discovery document; rebuild it only when the credentials object changes
+        if self.service is None or creds is not self._creds:
+            self._creds = creds
+            self._http_local = threading.local()
+            self.service = build('fitness', 'v1', http=self._http(), cache_discovery=False)
         print("✅ Google Fit authenticated successfully")
         return True
+
+    async def _refresh(self):
+        """Refresh the access token in a worker thread and persist it."""
+        try:
+            await asyncio.to_thread(self._creds.refresh, Request())
+            CredsCache.save(self._creds)
+            print("🔑 Google Fit token refreshed")
+        except Exception as e:
+            print(f"❌ Token refresh error: {e}")
+
+    def _schedule_refresh(self):
+        """Start a background refresh when the token is within TOKEN_REFRESH_MARGIN of expiry."""
+        creds = self._creds
+        if not creds or not creds.refresh_token or not creds.expiry:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        # google-auth keeps expiry as naive UTC
+        if creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN:
+            self._refresh_task = asyncio.create_task(self._refresh())
     
     def get_heart_rate(self, hours: int = 1) -> List[Dict]:
         """Get heart rate data from Google Fit."""
         if not self.service:
             return []
         
-        end_time = datetime.utcnow()
+        end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(hours=hours)
         
         # Convert to nanoseconds
-        start_ns = int(start_time.timestamp() * 1e9)
-        end_ns = int(end_time.timestamp() * 1e9)
+        start_ns = _to_ns(start_time)
+        end_ns = _to_ns(end_time)
         
         try:
             result = self.service.users().dataSources().datasets().get(
                 userId='me',
                 dataSourceId='derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm',
                 datasetId=f"{start_ns}-{end_ns}"
-            ).execute()
+            ).execute(http=self._http())
             
             readings = []
             for point in result.get('point', []):
-                timestamp = int(point['startTimeNanos']) / 1e9
                 value = point['value'][0].get('fpVal', 0)
                 readings.append({
-                    'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+                    'timestamp': _from_ns(int(point['startTimeNanos'])).isoformat(),
                     'heart_rate': value
                 })
             
@@ -153,7 +242,7 @@ class GoogleFitSync:
         if not self.service:
             return []
         
-        end_time = datetime.utcnow()
+        end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(hours=hours)
         
         body = {
@@ -161,14 +250,14 @@ class GoogleFitSync:
                 "dataTypeName": "com.google.oxygen_saturation"
             }],
             "bucketByTime": {"durationMillis": 3600000},  # 1 hour buckets
-            "startTimeMillis": int(start_time.timestamp() * 1000),
-            "endTimeMillis": int(end_time.timestamp() * 1000)
+            "startTimeMillis": _to_ms(start_time),
+            "endTimeMillis": _to_ms(end_time)
         }
         
         try:
             result = self.service.users().dataset().aggregate(
                 userId='me', body=body
-            ).execute()
+            ).execute(http=self._http())
             
             readings = []
             for bucket in result.get('bucket', []):
@@ -176,9 +265,7 @@ class GoogleFitSync:
                     for point in dataset.get('point', []):
                         if point.get('value'):
                             readings.append({
-                                'timestamp': datetime.fromtimestamp(
-                                    int(bucket['startTimeMillis']) / 1000
-                                ).isoformat(),
+                                'timestamp': _from_ms(int(bucket['startTimeMillis'])).isoformat(),
                                 'spo2': point['value'][0].get('fpVal', 0) * 100
                             })
             
@@ -192,7 +279,7 @@ class GoogleFitSync:
         if not self.service:
             return 0
         
-        end_time = datetime.utcnow()
+        end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(hours=hours)
         
         body = {
@@ -200,14 +287,14 @@ class GoogleFitSync:
                 "dataTypeName": "com.google.step_count.delta"
             }],
             "bucketByTime": {"durationMillis": 86400000},  # Daily
-            "startTimeMillis": int(start_time.timestamp() * 1000),
-            "endTimeMillis": int(end_time.timestamp() * 1000)
+            "startTimeMillis": _to_ms(start_time),
+            "endTimeMillis": _to_ms(end_time)
         }
         
         try:
             result = self.service.users().dataset().aggregate(
                 userId='me', body=body
-            ).execute()
+            ).execute(http=self._http())
             
             total_steps = 0
             for bucket in result.get('bucket', []):
@@ -221,30 +308,40 @@ class GoogleFitSync:
             print(f"Error fetching steps: {e}")
             return 0
     
-    def get_all_vitals(self, hours: int = 1) -> Dict:
-        """Get all available vitals from Google Fit."""
+    @staticmethod
+    def _combine_vitals(hr_data: List[Dict], spo2_data: List[Dict], steps: int) -> Dict:
         vitals = {
             'heart_rate': None,
             'spo2': None,
-            'steps': 0,
+            'steps': steps,
             'timestamp': datetime.utcnow().isoformat(),
             'source': 'google_fit'
         }
         
-        # Get latest heart rate
-        hr_data = self.get_heart_rate(hours)
+        # Latest heart rate / SpO2
         if hr_data:
             vitals['heart_rate'] = hr_data[-1]['heart_rate']
-        
-        # Get latest SpO2
-        spo2_data = self.get_spo2(hours)
         if spo2_data:
             vitals['spo2'] = spo2_data[-1]['spo2']
         
-        # Get steps
-        vitals['steps'] = self.get_steps(24)
-        
         return vitals
+
+    def get_all_vitals(self, hours: int = 1) -> Dict:
+        """Get all available vitals from Google Fit (the three requests run in parallel)."""
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            hr = pool.submit(self.get_heart_rate, hours)
+            spo2 = pool.submit(self.get_spo2, hours)
+            steps = pool.submit(self.get_steps, 24)
+            return self._combine_vitals(hr.result(), spo2.result(), steps.result())
+
+    async def get_all_vitals_async(self, hours: int = 1) -> Dict:
+        """Like get_all_vitals, without blocking the event loop."""
+        hr_data, spo2_data, steps = await asyncio.gather(
+            asyncio.to_thread(self.get_heart_rate, hours),
+            asyncio.to_thread(self.get_spo2, hours),
+            asyncio.to_thread(self.get_steps, 24),
+        )
+        return self._combine_vitals(hr_data, spo2_data, steps)
     
     def sync_to_database(self, hours: int = 1) -> int:
         """Sync Google Fit data to AEGIS database."""
@@ -254,18 +351,20 @@ class GoogleFitSync:
         try:
             # Get heart rate readings
             hr_readings = self.get_heart_rate(hours)
-            for reading in hr_readings:
-                event = HealthEvent(
-                    user_id=self.user_id,
-                    event_type="vitals",
-                    data={
-                        'heart_rate': reading['heart_rate'],
-                        'source': 'google_fit'
-                    },
-                    timestamp=datetime.fromisoformat(reading['timestamp'])
-                )
-                session.add(event)
-                saved += 1
+            rows = [{
+                'user_id': self.user_id,
+                'event_type': "vitals",
+                'data': {
+                    'heart_rate': reading['heart_rate'],
+                    'source': 'google_fit'
+                },
+                'timestamp': datetime.fromisoformat(reading['timestamp'])
+            } for reading in hr_readings]
+            
+            # One executemany INSERT (multi-row VALUES on Postgres) instead of an ORM add per row
+            if rows:
+                session.execute(insert(HealthEvent), rows)
+            saved = len(rows)
             
             session.commit()
             self.last_sync = datetime.utcnow()
@@ -279,30 +378,41 @@ class GoogleFitSync:
         
         return saved
     
+    def _persist_event(self, vitals: Dict):
+        """Store one combined vitals snapshot as a HealthEvent."""
+        session = SessionLocal()
+        try:
+            session.add(HealthEvent(
+                user_id=self.user_id,
+                event_type="vitals",
+                data=vitals,
+                timestamp=datetime.utcnow()
+            ))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
     async def continuous_sync(self, interval_minutes: int = 5):
         """Continuously sync data from Google Fit."""
         print(f"🔄 Starting continuous sync (every {interval_minutes} min)")
         
         while True:
             try:
-                vitals = self.get_all_vitals(hours=1)
+                # Refreshed in place: AuthorizedHttp and the service keep using the same creds object
+                self._schedule_refresh()
+                async with _sync_slots:
+                    vitals = await self.get_all_vitals_async(hours=1)
                 
                 if vitals['heart_rate']:
                     print(f"❤️  HR: {vitals['heart_rate']} bpm | "
                           f"🫁 SpO2: {vitals.get('spo2', 'N/A')}% | "
                           f"🚶 Steps: {vitals['steps']}")
                     
-                    # Save to database
-                    session = SessionLocal()
-                    event = HealthEvent(
-                        user_id=self.user_id,
-                        event_type="vitals",
-                        data=vitals,
-                        timestamp=datetime.utcnow()
-                    )
-                    session.add(event)
-                    session.commit()
-                    session.close()
+                    # Save to database off the event loop
+                    await asyncio.to_thread(self._persist_event, vitals)
                 else:
                     print("⏳ No new data from watch")
                 
@@ -21,323 +21,653 @@ Setup:
 3. Use MacroDroid/Tasker to POST data to AEGIS webhook
 """
 
+import hmac
+import itertools
+import logging
 import os
 import sys
+import time
 import json
 import asyncio
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List, Any
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, ValidationError
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ISO-8601 timestamps: ciso8601 (C) when installed; fromisoformat accepts a "Z" suffix from 3.11
+try:
+    from ciso8601 import parse_datetime as parse_timestamp
+except ImportError:
+    if sys.version_info >= (3, 11):
+        parse_timestamp = datetime.fromisoformat
+    else:
+        def parse_timestamp(value: str) -> datetime:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
-sys.path.insert(0, str(Path(__file__).parent.parent))
+# Imported as integrations.<module> the project root is already importable; only
+# running this file directly as a script needs it added
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).parent.parent))
 from database import SessionLocal
 from models import HealthEvent, User
 
+# Handlers are configured once by observability.setup_queue_logging at app startup;
+# %-style args are only formatted if the level is enabled.
+log = logging.getLogger("aegis.healthconnect")
+
+# Imported once here rather than inside the webhook; None when the module can't load
+try:
+    from integrations.twilio_emergency import check_critical_vitals, dispatch_if_sustained
+except Exception as e:
+    log.warning("emergency check unavailable: %s", e)
+    check_critical_vitals = dispatch_if_sustained = None
+
 # ============== SCHEMAS ==============
 
+# Canonical AEGIS vitals key -> incoming field names, highest priority first
+FIELD_ALIASES = {
+    'heart_rate': ('heart_rate', 'heartRate', 'hr'),
+    'spo2': ('spo2', 'bloodOxygen', 'oxygenSaturation'),
+    'systolic_bp': ('systolic', 'bloodPressureSystolic', 'systolic_bp'),
+    'diastolic_bp': ('diastolic', 'bloodPressureDiastolic', 'diastolic_bp'),
+    'steps': ('steps', 'stepCount'),
+    'calories_burned': ('calories_burned', 'calories', 'activeCalories'),
+    'temperature': ('body_temperature', 'temperature'),
+    'respiratory_rate': ('respiratory_rate', 'respiratoryRate'),
+    'resting_heart_rate': ('resting_heart_rate', 'restingHeartRate'),
+    'stress_level': ('stress', 'stressLevel', 'stress_level'),
+    'sleep_minutes': ('sleep_duration_minutes', 'sleepDuration', 'sleep_minutes'),
+    'hrv': ('heart_rate_variability', 'hrv'),
+    'weight_kg': ('weight_kg', 'weight'),
+    'body_fat_percent': ('body_fat_percent', 'bodyFat'),
+}
+
+
+# Non-vital measurements kept on stored readings, same layout as FIELD_ALIASES
+EXTRA_ALIASES = {
+    'height_cm': ('height_cm', 'height'),
+    'distance_meters': ('distance_meters', 'distance'),
+    'floors_climbed': ('floors_climbed', 'floors'),
+    'active_minutes': ('active_minutes', 'activeMinutes'),
+}
+READING_ALIASES = {**FIELD_ALIASES, **EXTRA_ALIASES}
+
+
+def _vital(canon: str):
+    """Optional field accepting any of the canonical key's aliases (resolved by pydantic-core)."""
+    return Field(None, validation_alias=AliasChoices(*READING_ALIASES[canon]))
+
+
 class HealthConnectReading(BaseModel):
-    """Health Connect / Health Sync data format from Android."""
-    # Vitals - multiple naming conventions supported
-    heart_rate: Optional[float] = None
-    heartRate: Optional[float] = None  # Health Sync format
-    hr: Optional[float] = None  # Alternative
-    
-    heart_rate_variability: Optional[float] = None
-    hrv: Optional[float] = None
-    resting_heart_rate: Optional[float] = None
-    restingHeartRate: Optional[float] = None
-    
-    spo2: Optional[float] = None  # Blood oxygen
-    bloodOxygen: Optional[float] = None  # Health Sync format
-    oxygenSaturation: Optional[float] = None
-    
-    respiratory_rate: Optional[float] = None
-    respiratoryRate: Optional[float] = None
+    """
+    Health Connect / Health Sync data format from Android.
+    Each value lands on its canonical AEGIS name whichever naming convention the app used.
+    """
+    model_config = ConfigDict(extra="allow")  # Accept any additional fields
+
+    # Vitals
+    heart_rate: Optional[float] = _vital('heart_rate')
+    hrv: Optional[float] = _vital('hrv')
+    resting_heart_rate: Optional[float] = _vital('resting_heart_rate')
+    spo2: Optional[float] = _vital('spo2')  # Blood oxygen
+    respiratory_rate: Optional[float] = _vital('respiratory_rate')
     
     # Blood Pressure
-    systolic: Optional[int] = None
-    diastolic: Optional[int] = None
-    bloodPressureSystolic: Optional[int] = None
-    bloodPressureDiastolic: Optional[int] = None
+    systolic_bp: Optional[int] = _vital('systolic_bp')
+    diastolic_bp: Optional[int] = _vital('diastolic_bp')
     
     # Body
-    weight_kg: Optional[float] = None
-    weight: Optional[float] = None
-    height_cm: Optional[float] = None
-    height: Optional[float] = None
-    body_fat_percent: Optional[float] = None
-    bodyFat: Optional[float] = None
-    body_temperature: Optional[float] = None
-    temperature: Optional[float] = None
+    weight_kg: Optional[float] = _vital('weight_kg')
+    height_cm: Optional[float] = _vital('height_cm')
+    body_fat_percent: Optional[float] = _vital('body_fat_percent')
+    temperature: Optional[float] = _vital('temperature')
     
     # Activity
-    steps: Optional[int] = None
-    stepCount: Optional[int] = None  # Health Sync format
-    distance_meters: Optional[float] = None
-    distance: Optional[float] = None
-    calories_burned: Optional[float] = None
-    calories: Optional[float] = None
-    activeCalories: Optional[float] = None
-    floors_climbed: Optional[int] = None
-    floors: Optional[int] = None
-    active_minutes: Optional[int] = None
-    activeMinutes: Optional[int] = None
+    steps: Optional[int] = _vital('steps')
+    distance_meters: Optional[float] = _vital('distance_meters')
+    calories_burned: Optional[float] = _vital('calories_burned')
+    floors_climbed: Optional[int] = _vital('floors_climbed')
+    active_minutes: Optional[int] = _vital('active_minutes')
     
     # Sleep
-    sleep_duration_minutes: Optional[int] = None
-    sleepDuration: Optional[int] = None
+    sleep_minutes: Optional[int] = _vital('sleep_minutes')
     sleep_stages: Optional[Dict] = None  # {deep, light, rem, awake}
     
     # Stress (Samsung Health specific)
-    stress: Optional[int] = None
-    stressLevel: Optional[int] = None
+    stress_level: Optional[int] = _vital('stress_level')
     
     # Metadata
-    timestamp: Optional[str] = None
-    date: Optional[str] = None  # Alternative timestamp
-    source_app: Optional[str] = "health_connect"
-    source: Optional[str] = None
+    timestamp: Optional[str] = Field(None, validation_alias=AliasChoices('timestamp', 'date'))
+    source_app: Optional[str] = Field("health_connect", validation_alias=AliasChoices('source_app', 'source'))
     device: Optional[str] = "samsung_galaxy_watch"
-    
-    class Config:
-        extra = "allow"  # Accept any additional fields
+
+
+def normalize_vitals(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the canonical vitals out of a dumped reading; empty/zero values are skipped."""
+    vitals = {canon: raw[canon] for canon in FIELD_ALIASES if raw.get(canon)}
+    # Blood pressure is only meaningful as a pair
+    if 'systolic_bp' not in vitals or 'diastolic_bp' not in vitals:
+        vitals.pop('systolic_bp', None)
+        vitals.pop('diastolic_bp', None)
+    return vitals
+
+
+# Webhook alert bounds: canonical key -> (low, high, message); None means unbounded
+ALERT_THRESHOLDS = {
+    'heart_rate': (40, 150, "Heart rate {} bpm is abnormal"),
+    'spo2': (90, None, "SpO2 {}% is critically low"),
+}
+
+
+def check_alert_thresholds(vitals: Dict[str, Any]) -> List[str]:
+    """Alert messages for every vital outside its ALERT_THRESHOLDS range."""
+    alerts = []
+    for key, (low, high, message) in ALERT_THRESHOLDS.items():
+        value = vitals.get(key)
+        if value is None:
+            continue
+        if (low is not None and value < low) or (high is not None and value > high):
+            alerts.append(message.format(value))
+    return alerts
+
+
+# Source/device labels repeat on every event; share one string object per known value
+_KNOWN_LABELS = {
+    label: sys.intern(label)
+    for label in ('health_connect', 'health_sync', 'galaxy_watch', 'samsung_galaxy_watch')
+}
+
+
+def _label(value: Optional[str], default: str) -> str:
+    value = value or default
+    return _KNOWN_LABELS.get(value, value)
+
+
+# Raw batch keys that are not stored as-is in a reading's vitals
+_ALIAS_KEYS = frozenset(alias for aliases in READING_ALIASES.values() for alias in aliases)
+_BATCH_META_KEYS = frozenset({'timestamp', 'date', 'source_app', 'source', 'device', 'sleep_stages'})
+
+
+# Canonical fields the model declares as int; the rest of READING_ALIASES are floats
+_INT_FIELDS = frozenset(
+    name for name, field in HealthConnectReading.model_fields.items()
+    if name in READING_ALIASES and field.annotation == Optional[int]
+)
+
+
+def _fast_vitals(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Vitals for a reading whose values the model would take verbatim (JSON ints/floats
+    of the declared type, string metadata), or None if anything needs pydantic's coercion.
+    """
+    vitals = {}
+    for canon, aliases in READING_ALIASES.items():
+        # Like AliasChoices: the first alias present wins, even when it is null
+        alias = next((a for a in aliases if a in raw), None)
+        if alias is None or raw[alias] is None:
+            continue
+        value = raw[alias]
+        if type(value) is int:
+            vitals[canon] = value if canon in _INT_FIELDS else float(value)
+        elif type(value) is float and canon not in _INT_FIELDS:
+            vitals[canon] = value
+        else:
+            return None
+    for key in ('timestamp', 'date', 'source_app', 'source', 'device'):
+        if raw.get(key) is not None and not isinstance(raw[key], str):
+            return None
+    if raw.get('sleep_stages') is not None and not isinstance(raw['sleep_stages'], dict):
+        return None
+    # Unknown fields are kept, as with the model's extra="allow"
+    for key, value in raw.items():
+        if value is not None and key not in _ALIAS_KEYS and key not in _BATCH_META_KEYS:
+            vitals[key] = value
+    return vitals
+
+
+def _to_row(raw: Dict[str, Any], user_id: int, now: datetime) -> Dict[str, Any]:
+    """
+    Build a health_events insert mapping straight from one raw batch reading.
+    Same result as dumping a HealthConnectReading; the model is only built when a
+    value needs coercion (e.g. numeric strings), and raises ValidationError on bad input.
+    """
+    vitals = _fast_vitals(raw)
+    if vitals is not None:
+        source = raw.get('source_app') if 'source_app' in raw else raw.get('source', 'health_connect')
+        timestamp = raw.get('timestamp') if 'timestamp' in raw else raw.get('date')
+    else:
+        reading = HealthConnectReading.model_validate(raw)
+        vitals = reading.model_dump(exclude_none=True, exclude={'timestamp', 'source_app', 'device', 'sleep_stages'})
+        source, timestamp = reading.source_app, reading.timestamp
+    vitals['source'] = _label(source, 'health_connect')
+    return {
+        'user_id': user_id,
+        'event_type': "vitals",
+        'data': vitals,
+        'timestamp': parse_timestamp(timestamp) if timestamp else now
+    }
 
 
 class HealthConnectBatch(BaseModel):
-    """Batch of Health Connect readings."""
+    """Batch of Health Connect readings (request schema; the handler reads the JSON directly)."""
     readings: List[HealthConnectReading]
     api_key: Optional[str] = None  # Simple auth for webhook
 
 
 # ============== WEBHOOK ROUTER ==============
 
-router = APIRouter(prefix="/health-connect", tags=["Health Connect"])
+# orjson encodes responses in C; fall back to the stdlib encoder when it isn't installed
+ResponseClass = ORJSONResponse if orjson is not None else JSONResponse
+
+router = APIRouter(prefix="/health-connect", tags=["Health Connect"], default_response_class=ResponseClass)
+
+
+async def _parse_body(request: Request, model):
+    """Validate the raw request body straight from JSON bytes (one parse, no intermediate dict)."""
+    try:
+        return model.model_validate_json(await request.body())
+    except ValidationError as e:
+        # Same 422 FastAPI returns for a body-parameter validation failure
+        raise RequestValidationError(e.errors())
+
+
+# Most automations POST exactly {"heart_rate", "spo2", "steps"[, "timestamp"]}.
+# That shape is checked by hand and built without running the validator.
+_FAST_KEYS = frozenset({'heart_rate', 'spo2', 'steps', 'timestamp'})
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
 
 
+def _fast_reading(body: bytes) -> Optional[HealthConnectReading]:
+    """HealthConnectReading for the common 3-field payload, or None to use full validation."""
+    if orjson is None:
+        return None
+    try:
+        j = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(j, dict) or not j.keys() <= _FAST_KEYS:
+        return None
+    hr, spo2, steps, ts = j.get('heart_rate'), j.get('spo2'), j.get('steps'), j.get('timestamp')
+    if ((hr is not None and not _is_number(hr)) or (spo2 is not None and not _is_number(spo2))
+            or (steps is not None and (not isinstance(steps, int) or isinstance(steps, bool)))
+            or (ts is not None and not isinstance(ts, str))):
+        return None
+    # Same field values the validator would produce (floats for the float fields)
+    return HealthConnectReading.model_construct(
+        heart_rate=None if hr is None else float(hr),
+        spo2=None if spo2 is None else float(spo2),
+        steps=steps,
+        timestamp=ts,
+    )
+
+
+# Resolved once at import; the webhook reads them on every request
+# For simplicity, the key is checked against an env variable
+# In production, store per-user API keys in database
+EXPECTED_KEY = os.getenv("HEALTH_CONNECT_API_KEY", "aegis-health-key").encode()
+DEFAULT_USER_ID = int(os.getenv("HEALTH_CONNECT_USER_ID", "2"))
+
+
+def api_key_valid(api_key: Optional[str]) -> bool:
+    """Constant-time comparison against the configured webhook key."""
+    return isinstance(api_key, str) and hmac.compare_digest(api_key.encode(), EXPECTED_KEY)
+
+
+_key_user_id: Optional[int] = None
+
 def get_user_from_key(api_key: str, db) -> Optional[User]:
     """Get user from simple API key (stored in env or user profile)."""
-    # For simplicity, check against env variable
-    # In production, store per-user API keys in database
-    expected_key = os.getenv("HEALTH_CONNECT_API_KEY", "aegis-health-key")
-    if api_key == expected_key:
-        # Return default user (or query by key)
-        return db.query(User).first()
-    return None
+    global _key_user_id
+    if not api_key_valid(api_key):
+        return None
+    if _key_user_id is not None:
+        # Primary-key get: served from the session's identity map when already loaded
+        return db.get(User, _key_user_id)
+    # Return default user (or query by key); only a found user is remembered
+    user = db.query(User).first()
+    if user is not None:
+        _key_user_id = user.id
+    return user
+
+
+# ---- Blocking DB work, run in the threadpool so the event loop keeps serving requests ----
+
+def _save_event(event: HealthEvent) -> int:
+    # The session (and its pooled connection) only lives for the INSERT; begin() commits or rolls back on exit
+    with SessionLocal.begin() as session:
+        session.add(event)
+        session.flush()
+        return event.id
+
+
+def _save_rows(rows: List[Dict[str, Any]]):
+    if not rows:
+        return
+    with SessionLocal.begin() as session:
+        # One executemany INSERT (multi-row VALUES on Postgres) instead of an ORM add per reading
+        session.execute(insert(HealthEvent), rows)
+
+
+def _save_rows_one_by_one(rows: List[Dict[str, Any]]):
+    # Fallback for a batch the database rejected: each row gets its own transaction,
+    # rows that still fail are dropped, and rows are removed from the list as they
+    # are handled so a retry after a transient error does not insert them twice
+    while rows:
+        try:
+            with SessionLocal.begin() as session:
+                session.execute(insert(HealthEvent), [rows[0]])
+        except (DataError, IntegrityError) as e:
+            log.error("dropping reading for user %s rejected by the database: %s", rows[0].get("user_id"), e)
+        rows.pop(0)
+
+
+# ---- Write coalescing for routine single readings ----
+# Non-critical webhook readings are queued and inserted together, every
+# INGEST_BATCH_SIZE readings or INGEST_FLUSH_INTERVAL seconds, whichever comes first.
+INGEST_BATCH_SIZE = int(os.getenv("HEALTH_CONNECT_BATCH_SIZE", "64"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("HEALTH_CONNECT_FLUSH_INTERVAL", "0.25"))
+INGEST_QUEUE_MAX = 4096
+# A failed insert is retried (the client already got 202), backing off up to 30s,
+# and dropped after INGEST_MAX_ATTEMPTS so one bad batch cannot stall the queue.
+# A batch rejected outright (constraint or data error) is retried row by row instead.
+INGEST_RETRY_BASE = 0.5
+INGEST_RETRY_MAX = 30.0
+INGEST_MAX_ATTEMPTS = 8
+
+_ingest_q: Optional[asyncio.Queue] = None
+_flusher_task: Optional[asyncio.Task] = None
+_ingest_seq = itertools.count(1)
+# Batch the flusher is collecting or retrying, and its insert while one is running;
+# _stop_flusher writes whatever is left of it at shutdown
+_inflight: List[Dict[str, Any]] = []
+_inflight_write: Optional[asyncio.Future] = None
+
+
+async def _flusher():
+    global _inflight_write
+    loop = asyncio.get_running_loop()
+    backoff = INGEST_RETRY_BASE
+    attempts = 0
+    one_by_one = False
+    while True:
+        if not _inflight:
+            _inflight.append(await _ingest_q.get())
+            deadline = loop.time() + INGEST_FLUSH_INTERVAL
+            while len(_inflight) < INGEST_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    _inflight.append(await asyncio.wait_for(_ingest_q.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        # Shielded: cancelling the flusher must not abandon an insert halfway
+        if one_by_one:
+            write = run_in_threadpool(_save_rows_one_by_one, _inflight)
+        else:
+            write = run_in_threadpool(_save_rows, list(_inflight))
+        _inflight_write = asyncio.ensure_future(write)
+        try:
+            await asyncio.shield(_inflight_write)
+        except asyncio.CancelledError:
+            raise
+        except (DataError, IntegrityError) as e:
+            _inflight_write = None
+            log.error("batch of %d readings rejected, inserting them one by one: %s", len(_inflight), e)
+            one_by_one = True
+            continue
+        except Exception as e:
+            _inflight_write = None
+            attempts += 1
+            if attempts < INGEST_MAX_ATTEMPTS:
+                log.error("flush of %d readings failed, retrying in %.1fs: %s", len(_inflight), backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, INGEST_RETRY_MAX)
+                continue
+            log.error("flush of %d readings failed %d times, readings dropped: %s", len(_inflight), attempts, e)
+        _inflight_write = None
+        _inflight.clear()
+        backoff = INGEST_RETRY_BASE
+        attempts = 0
+        one_by_one = False
+
+
+HEALTH_CONNECT_SOURCES = ('health_connect', 'galaxy_watch')
+
+# Last Health Connect reading seen by this process: (monotonic time, timestamp, vitals).
+# /status answers from it while fresh instead of querying the database on every poll.
+STATUS_CACHE_TTL = 60.0
+_last_status: Optional[tuple] = None
+
+
+def _remember_status(timestamp: datetime, vitals: Dict[str, Any]):
+    global _last_status
+    if vitals.get('source') in HEALTH_CONNECT_SOURCES:
+        _last_status = (time.monotonic(), timestamp, vitals)
+
+
+def _latest_vitals() -> Optional[HealthEvent]:
+    session = SessionLocal()
+    try:
+        return session.execute(
+            select(HealthEvent)
+            .where(
+                HealthEvent.event_type == "vitals",
+                HealthEvent.data["source"].as_string().in_(HEALTH_CONNECT_SOURCES),
+            )
+            .order_by(HealthEvent.timestamp.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+    finally:
+        session.close()
+
+
+@router.on_event("startup")
+async def _start_flusher():
+    global _ingest_q, _flusher_task
+    _ingest_q = asyncio.Queue(maxsize=INGEST_QUEUE_MAX)
+    _flusher_task = asyncio.create_task(_flusher())
+
+
+@router.on_event("shutdown")
+async def _stop_flusher():
+    if _flusher_task is None:
+        return
+    _flusher_task.cancel()
+    try:
+        await _flusher_task
+    except asyncio.CancelledError:
+        pass
+    # An insert that was running when the flusher stopped either landed or must be redone
+    if _inflight_write is not None:
+        try:
+            await _inflight_write
+            _inflight.clear()
+        except Exception:
+            pass
+    # Write the flusher's batch and whatever is still queued before the process exits
+    pending = list(_inflight)
+    _inflight.clear()
+    while not _ingest_q.empty():
+        pending.append(_ingest_q.get_nowait())
+    if pending:
+        try:
+            try:
+                await run_in_threadpool(_save_rows, pending)
+            except (DataError, IntegrityError):
+                await run_in_threadpool(_save_rows_one_by_one, pending)
+        except Exception as e:
+            log.error("shutdown flush of %d readings failed, readings lost: %s", len(pending), e)
 
 
 @router.post("/webhook")
-async def health_connect_webhook(data: HealthConnectReading, api_key: str = None):
+async def health_connect_webhook(request: Request, background_tasks: BackgroundTasks, api_key: str = None):
     """
     Webhook endpoint for Health Connect data from Android.
     
     Configure MacroDroid/Tasker to POST to:
     http://YOUR_SERVER:8000/health-connect/webhook?api_key=YOUR_KEY
     """
-    session = SessionLocal()
+    data = _fast_reading(await request.body()) or await _parse_body(request, HealthConnectReading)
     
     try:
         # Simple API key auth
-        expected_key = os.getenv("HEALTH_CONNECT_API_KEY", "aegis-health-key")
-        if api_key != expected_key:
+        if not api_key_valid(api_key):
             raise HTTPException(status_code=401, detail="Invalid API key")
         
         # Get user (default to user 2 for now)
-        user_id = int(os.getenv("HEALTH_CONNECT_USER_ID", "2"))
+        user_id = DEFAULT_USER_ID
         
         # Build vitals data - normalize all field name variants
-        vitals = {}
+        vitals = normalize_vitals(data.model_dump(exclude_none=True))
         
-        # Heart rate (multiple possible field names)
-        hr = data.heart_rate or data.heartRate or data.hr
-        if hr:
-            vitals['heart_rate'] = hr
+        vitals['source'] = _label(data.source_app, 'health_sync')
+        vitals['device'] = _label(data.device, 'galaxy_watch')
         
-        # SpO2 / Blood oxygen
-        spo2 = data.spo2 or data.bloodOxygen or data.oxygenSaturation
-        if spo2:
-            vitals['spo2'] = spo2
-        
-        # Blood pressure
-        systolic = data.systolic or data.bloodPressureSystolic
-        diastolic = data.diastolic or data.bloodPressureDiastolic
-        if systolic and diastolic:
-            vitals['systolic_bp'] = systolic
-            vitals['diastolic_bp'] = diastolic
-        
-        # Steps
-        steps = data.steps or data.stepCount
-        if steps:
-            vitals['steps'] = steps
-        
-        # Calories
-        calories = data.calories_burned or data.calories or data.activeCalories
-        if calories:
-            vitals['calories_burned'] = calories
-        
-        # Temperature
-        temp = data.body_temperature or data.temperature
-        if temp:
-            vitals['temperature'] = temp
-        
-        # Respiratory rate
-        resp = data.respiratory_rate or data.respiratoryRate
-        if resp:
-            vitals['respiratory_rate'] = resp
-        
-        # Resting heart rate
-        rhr = data.resting_heart_rate or data.restingHeartRate
-        if rhr:
-            vitals['resting_heart_rate'] = rhr
-        
-        # Stress level (Samsung Health)
-        stress = data.stress or data.stressLevel
-        if stress:
-            vitals['stress_level'] = stress
-        
-        # Sleep
-        sleep = data.sleep_duration_minutes or data.sleepDuration
-        if sleep:
-            vitals['sleep_minutes'] = sleep
-        
-        # HRV
-        hrv = data.heart_rate_variability or data.hrv
-        if hrv:
-            vitals['hrv'] = hrv
-        
-        # Weight & body composition
-        if data.weight_kg or data.weight:
-            vitals['weight_kg'] = data.weight_kg or data.weight
-        if data.body_fat_percent or data.bodyFat:
-            vitals['body_fat_percent'] = data.body_fat_percent or data.bodyFat
-        
-        vitals['source'] = data.source_app or data.source or 'health_sync'
-        vitals['device'] = data.device or 'galaxy_watch'
-        
-        # Parse timestamp
+        # Parse timestamp; a malformed one falls back to receive time
         timestamp = datetime.utcnow()
         if data.timestamp:
             try:
-                timestamp = datetime.fromisoformat(data.timestamp.replace('Z', '+00:00'))
-            except:
+                timestamp = parse_timestamp(data.timestamp)
+            except ValueError:
                 pass
         
-        # Save to database
+        # Check for alerts
+        alerts = check_alert_thresholds(vitals)
+        
+        emergency_alerts = check_critical_vitals(vitals) if check_critical_vitals else []
+        critical = bool(alerts) or bool(emergency_alerts)
+        
+        # Routine readings: queue for the next batched insert and acknowledge immediately
+        if not critical and _ingest_q is not None and not _ingest_q.full():
+            _ingest_q.put_nowait({
+                'user_id': user_id,
+                'event_type': "vitals",
+                'data': vitals,
+                'timestamp': timestamp
+            })
+            _remember_status(timestamp, vitals)
+            return ResponseClass(
+                {"status": "queued", "id": next(_ingest_seq), "alerts": alerts},
+                status_code=202
+            )
+        
+        # Critical readings are written straight away: the sustained-critical check reads them back
         event = HealthEvent(
             user_id=user_id,
             event_type="vitals",
             data=vitals,
             timestamp=timestamp
         )
-        session.add(event)
-        session.commit()
-        
-        print(f"[HEALTH CONNECT] Saved: HR={data.heart_rate}, SpO2={data.spo2}, Steps={data.steps}")
-        
-        # Check for alerts
-        alerts = []
-        if data.heart_rate and (data.heart_rate < 40 or data.heart_rate > 150):
-            alerts.append(f"Heart rate {data.heart_rate} bpm is abnormal")
-        if data.spo2 and data.spo2 < 90:
-            alerts.append(f"SpO2 {data.spo2}% is critically low")
+        event_id = await run_in_threadpool(_save_event, event)
+        _remember_status(timestamp, vitals)
         
-        # Check for sustained critical vitals and auto-trigger emergency call
-        emergency_result = None
-        try:
-            from integrations.twilio_emergency import auto_trigger_emergency_if_critical
-            emergency_result = auto_trigger_emergency_if_critical(user_id, vitals)
-        except Exception as e:
-            print(f"[EMERGENCY CHECK ERROR] {e}")
+        log.info("saved hr=%s spo2=%s steps=%s", data.heart_rate, data.spo2, data.steps)
         
         response = {
             "status": "success",
-            "event_id": event.id,
+            "event_id": event_id,
             "alerts": alerts
         }
         
-        if emergency_result:
-            response["emergency_call"] = emergency_result
-            response["status"] = "EMERGENCY"
+        # The sustained-critical history check and any Twilio calls run after the
+        # response is sent (FastAPI attaches background_tasks to the returned response)
+        if emergency_alerts and dispatch_if_sustained:
+            background_tasks.add_task(dispatch_if_sustained, user_id, vitals)
+            response["emergency_check"] = "scheduled"
         
-        return response
+        return ResponseClass(response)
         
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 @router.post("/webhook/batch")
-async def health_connect_batch_webhook(batch: HealthConnectBatch):
+async def health_connect_batch_webhook(request: Request):
     """Batch webhook for multiple readings."""
-    session = SessionLocal()
-    saved = 0
+    # Backfills can carry thousands of readings: map the decoded JSON straight to
+    # insert rows instead of building a pydantic model per reading
+    try:
+        body = (orjson.loads if orjson is not None else json.loads)(await request.body())
+    except ValueError as e:
+        raise RequestValidationError([{"loc": ("body",), "msg": f"Invalid JSON: {e}", "type": "json_invalid"}])
+    readings = body.get('readings') if isinstance(body, dict) else None
+    if not isinstance(readings, list):
+        raise RequestValidationError([{"loc": ("body", "readings"), "msg": "Field required", "type": "missing"}])
     
     try:
-        expected_key = os.getenv("HEALTH_CONNECT_API_KEY", "aegis-health-key")
-        if batch.api_key != expected_key:
+        if not api_key_valid(body.get('api_key')):
             raise HTTPException(status_code=401, detail="Invalid API key")
         
-        user_id = int(os.getenv("HEALTH_CONNECT_USER_ID", "2"))
+        user_id = DEFAULT_USER_ID
         
-        for reading in batch.readings:
-            vitals = {
-                k: v for k, v in reading.dict().items()
-                if v is not None and k not in ['timestamp', 'source_app', 'device', 'sleep_stages']
-            }
-            vitals['source'] = reading.source_app or 'health_connect'
-            
-            event = HealthEvent(
-                user_id=user_id,
-                event_type="vitals",
-                data=vitals,
-                timestamp=datetime.fromisoformat(reading.timestamp) if reading.timestamp else datetime.utcnow()
-            )
-            session.add(event)
-            saved += 1
+        now = datetime.utcnow()
+        rows = []
+        for i, reading in enumerate(readings):
+            try:
+                if not isinstance(reading, dict):
+                    raise ValueError("reading must be an object")
+                rows.append(_to_row(reading, user_id, now))
+            except ValidationError as e:
+                raise RequestValidationError([
+                    {**err, "loc": ("body", "readings", i, *err["loc"])} for err in e.errors()
+                ])
+            except ValueError as e:
+                raise RequestValidationError([{"loc": ("body", "readings", i), "msg": str(e), "type": "value_error"}])
         
-        session.commit()
-        print(f"[HEALTH CONNECT] Batch saved {saved} readings")
+        await run_in_threadpool(_save_rows, rows)
+        if rows:
+            _remember_status(rows[-1]['timestamp'], rows[-1]['data'])
+        saved = len(rows)
+        log.info("batch saved %d readings", saved)
         
-        return {"status": "success", "saved": saved}
+        return ResponseClass({"status": "success", "saved": saved})
         
-    except HTTPException:
+    except (HTTPException, RequestValidationError):
         raise
     except Exception as e:
-        session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 @router.get("/status")
 async def health_connect_status():
     """Check Health Connect integration status."""
-    session = SessionLocal()
-    
-    try:
+    cached = _last_status
+    if cached and time.monotonic() - cached[0] < STATUS_CACHE_TTL:
+        _, timestamp, data = cached
+    else:
         # Get latest Health Connect reading
-        latest = session.query(HealthEvent).filter(
-            HealthEvent.event_type == "vitals"
-        ).order_by(HealthEvent.timestamp.desc()).first()
-        
-        if latest and latest.data.get('source') in ['health_connect', 'galaxy_watch']:
-            return {
-                "status": "connected",
-                "last_sync": latest.timestamp.isoformat(),
-                "last_data": latest.data
-            }
-        
+        latest = await run_in_threadpool(_latest_vitals)
+        timestamp, data = (latest.timestamp, latest.data) if latest else (None, None)
+        if latest:
+            _remember_status(timestamp, data)
+    
+    if timestamp is not None:
         return {
-            "status": "waiting",
-            "message": "No Health Connect data received yet. Configure your Android app to POST to /health-connect/webhook"
+            "status": "connected",
+            "last_sync": timestamp.isoformat(),
+            "last_data": data
         }
-    finally:
-        session.close()
+    
+    return {
+        "status": "waiting",
+        "message": "No Health Connect data received yet. Configure your Android app to POST to /health-connect/webhook"
+    }
 
 
 # ============== MACRODROID TEMPLATE ==============
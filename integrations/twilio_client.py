@@ -0,0 +1,48 @@
+"""
+Shared Twilio REST client for AEGIS.
+
+twilio_emergency (voice/SMS) and twilio_whatsapp both talk to the Twilio API.
+Going through get_client() gives them one Client per credential pair, backed by a
+pooled keep-alive HTTPS session, so an emergency fan-out doesn't pay a TCP+TLS
+handshake per call or message.
+"""
+
+import threading
+from typing import Dict, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 32
+HTTP_TIMEOUT = 10  # seconds
+
+_clients: Dict[Tuple[str, str], Client] = {}
+_lock = threading.Lock()
+
+
+def _build_http_client() -> TwilioHttpClient:
+    http = TwilioHttpClient(pool_connections=True, timeout=HTTP_TIMEOUT)
+    # POST isn't in Retry's allowed methods, so only failed connects are retried (no duplicate calls/SMS)
+    http.session.mount("https://", HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    ))
+    return http
+
+
+def get_client(account_sid: str, auth_token: str) -> Client:
+    """Process-wide Client for these credentials, created on first use."""
+    key = (account_sid, auth_token)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = Client(account_sid, auth_token, http_client=_build_http_client())
+            _clients[key] = client
+    return client
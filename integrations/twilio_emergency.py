@@ -16,9 +16,18 @@ Setup:
    - TWILIO_PHONE_NUMBER
 """
 
+import logging
 import os
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+log = logging.getLogger("aegis.emergency")
 
 # Twilio imports
 try:
@@ -27,9 +36,15 @@ try:
     TWILIO_AVAILABLE = True
 except ImportError:
     TWILIO_AVAILABLE = False
-    print("[WARNING] Twilio not installed. Run: pip install twilio")
+    log.warning("Twilio not installed. Run: pip install twilio")
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 from database import SessionLocal
+from sqlalchemy import func, select, text
 import models
 
 # Configuration from environment
@@ -48,61 +63,148 @@ CRITICAL_THRESHOLDS = {
     "respiratory_rate": {"min": 8, "max": 30}
 }
 
+# Threshold table as arrays so a reading (or a stack of readings) is checked in one comparison.
+# Missing vitals become NaN, which compares False against both bounds.
+VITAL_NAMES = tuple(CRITICAL_THRESHOLDS)
+_MIN_T = np.array([CRITICAL_THRESHOLDS[k].get("min", -np.inf) for k in VITAL_NAMES], dtype=float)
+_MAX_T = np.array([CRITICAL_THRESHOLDS[k].get("max", np.inf) for k in VITAL_NAMES], dtype=float)
+_DISPLAY_NAMES = tuple(k.replace('_', ' ').title() for k in VITAL_NAMES)
+
 # Sustained critical settings
 SUSTAINED_CRITICAL_COUNT = 3  # Number of consecutive critical readings required
 SUSTAINED_CRITICAL_WINDOW_MINUTES = 5  # Time window to check for sustained readings
 
 
+# Computed once; checked on every vitals reading via auto_trigger_emergency_if_critical
+_IS_CONFIGURED = bool(TWILIO_AVAILABLE and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER)
+
+
 def is_twilio_configured() -> bool:
     """Check if Twilio is properly configured."""
-    return all([
-        TWILIO_AVAILABLE,
-        TWILIO_ACCOUNT_SID,
-        TWILIO_AUTH_TOKEN,
-        TWILIO_PHONE_NUMBER
-    ])
+    return _IS_CONFIGURED
+
+
+def reload_twilio_config():
+    """Re-read the TWILIO_* environment variables (tests / runtime reconfiguration)."""
+    global TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, _IS_CONFIGURED
+    TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+    TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+    TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+    _IS_CONFIGURED = bool(TWILIO_AVAILABLE and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER)
 
 
 def get_twilio_client():
     """Get Twilio client instance."""
     if not is_twilio_configured():
         return None
-    return Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    from integrations.twilio_client import get_client
+    return get_client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
 
-def check_critical_vitals(vitals: Dict[str, Any]) -> List[Dict[str, Any]]:
+def vitals_matrix(readings: List[Dict[str, Any]]) -> np.ndarray:
+    """(N, len(VITAL_NAMES)) float array of readings, NaN where a vital is missing."""
+    return np.array([[r.get(k) for k in VITAL_NAMES] for r in readings], dtype=float).reshape(-1, len(VITAL_NAMES))
+
+
+def critical_rows(matrix: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows in a vitals_matrix with any vital outside its thresholds."""
+    return ((matrix < _MIN_T) | (matrix > _MAX_T)).any(axis=1)
+
+
+def critical_details(readings: List[Dict[str, Any]], limit: Optional[int] = None) -> List[Dict[str, Any]]:
     """
-    Check if any vital signs exceed critical thresholds.
-    Returns list of critical readings with details.
+    Alert details for every out-of-range vital across `readings` (row order, then
+    VITAL_NAMES order), from a single threshold comparison over the stacked readings.
     """
-    critical_alerts = []
+    matrix = vitals_matrix(readings)
+    low = matrix < _MIN_T
+    high = matrix > _MAX_T
     
-    for vital_name, thresholds in CRITICAL_THRESHOLDS.items():
-        value = vitals.get(vital_name)
-        if value is None:
-            continue
-            
-        if "min" in thresholds and value < thresholds["min"]:
-            critical_alerts.append({
-                "vital": vital_name,
-                "value": value,
-                "threshold": f"< {thresholds['min']}",
-                "severity": "CRITICAL",
-                "message": f"{vital_name.replace('_', ' ').title()} critically low: {value}"
-            })
-        
-        if "max" in thresholds and value > thresholds["max"]:
-            critical_alerts.append({
-                "vital": vital_name,
-                "value": value,
-                "threshold": f"> {thresholds['max']}",
-                "severity": "CRITICAL",
-                "message": f"{vital_name.replace('_', ' ').title()} critically high: {value}"
-            })
+    critical_alerts = []
+    for row, i in zip(*np.nonzero(low | high)):
+        if limit is not None and len(critical_alerts) >= limit:
+            break
+        vital_name = VITAL_NAMES[i]
+        value = readings[row][vital_name]
+        is_low = low[row, i]
+        bound = "min" if is_low else "max"
+        critical_alerts.append({
+            "vital": vital_name,
+            "value": value,
+            "threshold": f"{'<' if is_low else '>'} {CRITICAL_THRESHOLDS[vital_name][bound]}",
+            "severity": "CRITICAL",
+            "message": f"{_DISPLAY_NAMES[i]} critically {'low' if is_low else 'high'}: {value}"
+        })
     
     return critical_alerts
 
 
+def check_critical_vitals(vitals: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Check if any vital signs exceed critical thresholds.
+    Returns list of critical readings with details.
+    """
+    return critical_details([vitals])
+
+
+# One round-trip on Postgres: the newest N vitals in the window, how many of them
+# are critical (CASE over the JSON fields), and the last vital_alert call for the spam guard.
+_CRITICAL_SQL = " OR ".join(
+    f"(data->>'{name}')::float {op} {bound}"
+    for name, limits in CRITICAL_THRESHOLDS.items()
+    for op, bound in (("<", limits.get("min")), (">", limits.get("max")))
+    if bound is not None
+)
+
+SUSTAINED_SQL = f"""
+WITH recent AS (
+    SELECT data, timestamp FROM health_events
+    WHERE user_id = :user_id AND event_type = 'vitals' AND timestamp >= :window_start
+    ORDER BY timestamp DESC
+    LIMIT :n
+)
+SELECT
+    (SELECT COUNT(*) FROM recent) AS readings,
+    (SELECT COALESCE(SUM(CASE WHEN {_CRITICAL_SQL} THEN 1 ELSE 0 END), 0) FROM recent) AS critical_count,
+    (SELECT json_agg(data ORDER BY timestamp DESC) FROM recent) AS recent_data,
+    (SELECT MAX(timestamp) FROM emergency_call_logs
+        WHERE user_id = :user_id AND trigger_type = 'vital_alert' AND status <> 'failed'
+            AND timestamp >= :call_since) AS last_call
+"""
+
+
+def _sustained_window(session, user_id: int, window_start, call_since) -> Tuple[List[Dict[str, Any]], int, Any]:
+    """Newest vitals in the window (newest first), their critical count, and the last recent call."""
+    if session.bind.dialect.name == "postgresql":
+        row = session.execute(text(SUSTAINED_SQL), {
+            "user_id": user_id,
+            "window_start": window_start,
+            "call_since": call_since,
+            "n": SUSTAINED_CRITICAL_COUNT,
+        }).one()
+        return row.recent_data or [], int(row.critical_count), row.last_call
+
+    # SQLite: plain column selects, no ORM hydration
+    HealthEvent = models.HealthEvent
+    readings = [data or {} for data in session.execute(
+        select(HealthEvent.data).where(
+            HealthEvent.user_id == user_id,
+            HealthEvent.event_type == "vitals",
+            HealthEvent.timestamp >= window_start
+        ).order_by(HealthEvent.timestamp.desc()).limit(SUSTAINED_CRITICAL_COUNT)
+    ).scalars()]
+    critical_count = int(critical_rows(vitals_matrix(readings)).sum()) if readings else 0
+    last_call = session.execute(
+        select(func.max(models.EmergencyCallLog.timestamp)).where(
+            models.EmergencyCallLog.user_id == user_id,
+            models.EmergencyCallLog.trigger_type == "vital_alert",
+            models.EmergencyCallLog.status != "failed",
+            models.EmergencyCallLog.timestamp >= call_since
+        )
+    ).scalar()
+    return readings, critical_count, last_call
+
+
 def check_sustained_critical(user_id: int, current_vitals: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
     """
     Check if vitals have been critical for a sustained period.
@@ -111,57 +213,33 @@ def check_sustained_critical(user_id: int, current_vitals: Dict[str, Any] = None
     
     Returns emergency info if sustained critical detected, None otherwise.
     """
-    from datetime import datetime, timedelta
-    
     session = SessionLocal()
     try:
-        # Get recent vitals within the window
-        window_start = datetime.now() - timedelta(minutes=SUSTAINED_CRITICAL_WINDOW_MINUTES)
+        now = datetime.now()
+        window_start = now - timedelta(minutes=SUSTAINED_CRITICAL_WINDOW_MINUTES)
+        # Check if we already called in the last 30 minutes (prevent spam)
+        call_since = now - timedelta(seconds=CALL_GUARD_SECONDS)
+        readings, critical_count, recent_call = _sustained_window(session, user_id, window_start, call_since)
         
-        recent_events = session.query(models.HealthEvent).filter(
-            models.HealthEvent.user_id == user_id,
-            models.HealthEvent.event_type == "vitals",
-            models.HealthEvent.timestamp >= window_start
-        ).order_by(models.HealthEvent.timestamp.desc()).limit(10).all()
-        
-        if len(recent_events) < SUSTAINED_CRITICAL_COUNT:
+        if len(readings) < SUSTAINED_CRITICAL_COUNT:
             # Not enough readings yet
             return None
         
-        # Check last N readings for critical values
-        critical_count = 0
-        critical_details = []
-        
-        for event in recent_events[:SUSTAINED_CRITICAL_COUNT]:
-            vitals = event.data or {}
-            alerts = check_critical_vitals(vitals)
-            if alerts:
-                critical_count += 1
-                critical_details.extend(alerts)
-        
         if critical_count >= SUSTAINED_CRITICAL_COUNT:
             # Sustained critical detected!
-            print(f"🚨 [SUSTAINED CRITICAL] User {user_id}: {critical_count} consecutive critical readings")
-            
-            # Check if we already called in the last 30 minutes (prevent spam)
-            thirty_min_ago = datetime.now() - timedelta(minutes=30)
-            recent_call = session.query(models.EmergencyCallLog).filter(
-                models.EmergencyCallLog.user_id == user_id,
-                models.EmergencyCallLog.timestamp >= thirty_min_ago,
-                models.EmergencyCallLog.trigger_type == "vital_alert"
-            ).first()
+            log.warning("🚨 [SUSTAINED CRITICAL] User %s: %s consecutive critical readings", user_id, critical_count)
             
             if recent_call:
-                print(f"    ⏭️ Skipping - already called {recent_call.timestamp}")
+                log.info("⏭️ Skipping - already called %s", recent_call)
                 return None
             
             # Get the most critical reading
-            latest_vitals = recent_events[0].data if recent_events else current_vitals
+            latest_vitals = readings[0] if readings else current_vitals
             
             return {
                 "trigger": True,
                 "reason": f"Sustained critical vitals detected ({critical_count} readings)",
-                "details": critical_details[:3],  # Top 3 alerts
+                "details": critical_details(readings, limit=3),  # Top 3 alerts
                 "vitals": latest_vitals,
                 "readings_count": critical_count
             }
@@ -169,12 +247,75 @@ def check_sustained_critical(user_id: int, current_vitals: Dict[str, Any] = None
         return None
         
     except Exception as e:
-        print(f"[SUSTAINED CHECK ERROR] {e}")
+        log.error("sustained check failed: %s", e)
         return None
     finally:
         session.close()
 
 
+# Users whose sustained-critical check / dispatch is already running in this process,
+# so a burst of critical readings dials the contacts once
+_dispatch_in_flight = set()
+_dispatch_lock = threading.Lock()
+
+# user_id -> monotonic time this process last auto-dialled the user's contacts, so a
+# burst of critical readings after a call skips the history query. Vitals reach
+# health_events through several writers (Google Fit sync, CSV ingest, other workers),
+# so only the DB history can decide whether an alert is sustained.
+CALL_GUARD_SECONDS = 30 * 60
+_last_call: Dict[int, float] = {}
+
+
+def dispatch_if_sustained(user_id: int, vitals: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Slow half of auto_trigger_emergency_if_critical: reads the vitals history and,
+    if the alert is sustained, places the emergency calls. Run it off the request
+    path (e.g. as a FastAPI background task) once check_critical_vitals has fired.
+    
+    Returns call result if triggered, None otherwise.
+    """
+    now = time.monotonic()
+    with _dispatch_lock:
+        if user_id in _dispatch_in_flight:
+            log.info("⏭️ Emergency check already running for user %s", user_id)
+            return None
+        last_call = _last_call.get(user_id)
+        if last_call is not None:
+            if now - last_call < CALL_GUARD_SECONDS:
+                return None  # Already called recently from this process
+            del _last_call[user_id]
+        _dispatch_in_flight.add(user_id)
+    
+    result = None
+    try:
+        # Check for sustained critical
+        sustained = check_sustained_critical(user_id, vitals)
+        
+        if sustained and sustained.get("trigger"):
+            log.warning("🚨🚨🚨 [AUTO-EMERGENCY] Triggering emergency call for user %s", user_id)
+            
+            # Build reason message
+            alert_msgs = [d.get("message", "") for d in sustained.get("details", [])]
+            reason = f"CRITICAL VITALS ALERT: {'; '.join(alert_msgs[:2])}"
+            
+            # Make the call
+            result = make_emergency_call(
+                user_id=user_id,
+                reason=reason,
+                trigger_type="vital_alert",
+                vitals=vitals
+            )
+        
+        return result
+    finally:
+        with _dispatch_lock:
+            _dispatch_in_flight.discard(user_id)
+            # make_emergency_call reports success even when every call failed; only a
+            # call that actually went out may hold back retries
+            if result and any(c.get("call_sid") for c in result.get("calls", [])):
+                _last_call[user_id] = time.monotonic()
+
+
 def auto_trigger_emergency_if_critical(user_id: int, vitals: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Called after each vitals reading. Checks for sustained critical and auto-triggers emergency.
@@ -186,27 +327,7 @@ def auto_trigger_emergency_if_critical(user_id: int, vitals: Dict[str, Any]) ->
     if not current_alerts:
         return None  # Current reading is fine, no need to check history
     
-    # Check for sustained critical
-    sustained = check_sustained_critical(user_id, vitals)
-    
-    if sustained and sustained.get("trigger"):
-        print(f"🚨🚨🚨 [AUTO-EMERGENCY] Triggering emergency call for user {user_id}")
-        
-        # Build reason message
-        alert_msgs = [d.get("message", "") for d in sustained.get("details", [])]
-        reason = f"CRITICAL VITALS ALERT: {'; '.join(alert_msgs[:2])}"
-        
-        # Make the call
-        result = make_emergency_call(
-            user_id=user_id,
-            reason=reason,
-            trigger_type="vital_alert",
-            vitals=vitals
-        )
-        
-        return result
-    
-    return None
+    return dispatch_if_sustained(user_id, vitals)
 
 
 def get_emergency_contacts(user_id: int, session=None) -> List[models.EmergencyContact]:
@@ -227,6 +348,62 @@ def get_emergency_contacts(user_id: int, session=None) -> List[models.EmergencyC
             session.close()
 
 
+def _contacts_to_alert(session, user_id: int, contact_id: Optional[int] = None) -> List[models.EmergencyContact]:
+    """
+    The (up to 3) contacts an emergency call/SMS goes to, in one query: the given
+    contact if `contact_id` is set (it must belong to the user), otherwise the
+    user's active contacts by priority.
+    """
+    stmt = select(models.EmergencyContact).where(models.EmergencyContact.user_id == user_id)
+    if contact_id:
+        stmt = stmt.where(models.EmergencyContact.id == contact_id)
+    else:
+        stmt = stmt.where(models.EmergencyContact.is_active == "true")
+    stmt = stmt.order_by(models.EmergencyContact.priority).limit(3)
+    return list(session.execute(stmt).scalars())
+
+
+# user_id -> (expires_at, patient_name, contact targets) for the default recipients.
+# Both change rarely; main.py's contact endpoints call invalidate_user on every edit.
+# Targets are (id, name, relationship, phone) tuples, never ORM objects.
+RECIPIENT_CACHE_TTL = 300
+_RECIPIENT_CACHE_MAX = 10000
+_recipient_cache: Dict[int, Tuple[float, str, Tuple[Tuple[int, str, str, str], ...]]] = {}
+_recipient_lock = threading.Lock()
+
+
+def invalidate_user(user_id: int):
+    """Forget the cached patient name / emergency contacts for a user."""
+    with _recipient_lock:
+        _recipient_cache.pop(user_id, None)
+
+
+def _recipients(session, user_id: int, contact_id: Optional[int] = None) -> Optional[Tuple[str, Tuple[Tuple[int, str, str, str], ...]]]:
+    """(patient_name, contact targets) for an emergency call/SMS; None if the user doesn't exist."""
+    now = time.monotonic()
+    if not contact_id:
+        with _recipient_lock:
+            hit = _recipient_cache.get(user_id)
+        if hit is not None and hit[0] > now:
+            return hit[1], hit[2]
+    
+    email = session.execute(select(models.User.email).where(models.User.id == user_id)).scalar()
+    if email is None:
+        return None
+    patient_name = email.split("@")[0].title()  # Use email prefix as name
+    targets = tuple((c.id, c.name, c.relationship, c.phone_number) for c in _contacts_to_alert(session, user_id, contact_id))
+    
+    if not contact_id:
+        with _recipient_lock:
+            if len(_recipient_cache) >= _RECIPIENT_CACHE_MAX:
+                for uid in [uid for uid, entry in _recipient_cache.items() if entry[0] <= now]:
+                    del _recipient_cache[uid]
+            _recipient_cache[user_id] = (now + RECIPIENT_CACHE_TTL, patient_name, targets)
+    return patient_name, targets
+
+
+# Repeat alerts for the same patient/reason/vitals reuse the rendered XML
+@lru_cache(maxsize=256)
 def generate_emergency_twiml(
     patient_name: str,
     reason: str,
@@ -300,6 +477,28 @@ def generate_emergency_twiml(
     return str(response)
 
 
+def _place_call(client, target: Tuple[int, str, str, str], twiml: str) -> Tuple[Optional[str], Optional[Exception]]:
+    """Start one emergency call; returns (call_sid, None) or (None, error)."""
+    _, name, relationship, phone = target
+    log.info("📞 Calling %s (%s) at %s", name, relationship, phone)
+    try:
+        call = client.calls.create(
+            to=phone,
+            from_=TWILIO_PHONE_NUMBER,
+            twiml=twiml,
+            status_callback=f"{AEGIS_BASE_URL}/emergency/status",
+            status_callback_event=["initiated", "ringing", "answered", "completed"],
+            status_callback_method="POST",
+            timeout=30,  # Ring for 30 seconds
+            record=True  # Record for documentation
+        )
+        log.info("✅ Call initiated: %s", call.sid)
+        return call.sid, None
+    except Exception as e:
+        log.error("❌ Failed to call %s: %s", name, e)
+        return None, e
+
+
 def make_emergency_call(
     user_id: int,
     reason: str,
@@ -320,13 +519,11 @@ def make_emergency_call(
     Returns:
         Dict with call status and details
     """
-    print(f"\n🚨 [EMERGENCY] Initiating emergency call for user {user_id}")
-    print(f"    Reason: {reason}")
-    print(f"    Trigger: {trigger_type}")
+    log.warning("🚨 [EMERGENCY] Initiating emergency call for user %s (trigger: %s): %s", user_id, trigger_type, reason)
     
     if not is_twilio_configured():
         error_msg = "Twilio not configured. Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER"
-        print(f"    ❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         return {
             "success": False,
             "error": error_msg,
@@ -335,24 +532,16 @@ def make_emergency_call(
     
     session = SessionLocal()
     try:
-        # Get user info
-        user = session.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
+        # Get user info and emergency contacts (cached per user)
+        recipients = _recipients(session, user_id, contact_id)
+        if recipients is None:
             return {"success": False, "error": "User not found"}
         
-        patient_name = user.email.split("@")[0].title()  # Use email prefix as name
+        patient_name, targets = recipients
         
-        # Get emergency contacts
-        if contact_id:
-            contacts = [session.query(models.EmergencyContact).filter(
-                models.EmergencyContact.id == contact_id
-            ).first()]
-        else:
-            contacts = get_emergency_contacts(user_id, session)
-        
-        if not contacts or not contacts[0]:
+        if not targets:
             error_msg = "No emergency contacts configured for this user"
-            print(f"    ⚠️ {error_msg}")
+            log.warning("⚠️ %s", error_msg)
             return {
                 "success": False,
                 "error": error_msg,
@@ -374,63 +563,50 @@ def make_emergency_call(
         # Get Twilio client
         client = get_twilio_client()
         
-        call_results = []
+        # Same message for every contact: generate the TwiML once
+        twiml = generate_emergency_twiml(
+            patient_name=patient_name,
+            reason=reason,
+            vitals_info=vitals_info
+        )
         
-        # Call each contact (up to 3)
-        for contact in contacts[:3]:
-            print(f"    📞 Calling {contact.name} ({contact.relationship}) at {contact.phone_number}")
-            
-            try:
-                # Generate TwiML
-                twiml = generate_emergency_twiml(
-                    patient_name=patient_name,
-                    reason=reason,
-                    vitals_info=vitals_info
-                )
-                
-                # Make the call
-                call = client.calls.create(
-                    to=contact.phone_number,
-                    from_=TWILIO_PHONE_NUMBER,
-                    twiml=twiml,
-                    status_callback=f"{AEGIS_BASE_URL}/emergency/status",
-                    status_callback_event=["initiated", "ringing", "answered", "completed"],
-                    status_callback_method="POST",
-                    timeout=30,  # Ring for 30 seconds
-                    record=True  # Record for documentation
-                )
-                
-                # Log the call
-                call_log = models.EmergencyCallLog(
-                    user_id=user_id,
-                    contact_id=contact.id,
-                    trigger_type=trigger_type,
-                    trigger_details={
-                        "reason": reason,
-                        "vitals": vitals
-                    },
-                    call_sid=call.sid,
-                    status="initiated"
-                )
-                session.add(call_log)
-                session.commit()
-                
-                call_results.append({
-                    "contact_name": contact.name,
-                    "phone": contact.phone_number,
-                    "call_sid": call.sid,
-                    "status": "initiated"
-                })
-                
-                print(f"    ✅ Call initiated: {call.sid}")
-                
-            except Exception as e:
-                print(f"    ❌ Failed to call {contact.name}: {e}")
+        # Call each contact (up to 3) at once, so the last one rings as soon as the first.
+        # Workers only get plain values; ORM objects and the session stay on this thread.
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            outcomes = list(pool.map(lambda target: _place_call(client, target, twiml), targets))
+        
+        # Failed attempts are logged too; all rows go in with one commit
+        call_logs = []
+        call_results = []
+        for (contact_id_, name, _, phone), (call_sid, error) in zip(targets, outcomes):
+            call_logs.append(models.EmergencyCallLog(
+                user_id=user_id,
+                contact_id=contact_id_,
+                trigger_type=trigger_type,
+                trigger_details={
+                    "reason": reason,
+                    "vitals": vitals,
+                    **({"error": str(error)} if error is not None else {})
+                },
+                call_sid=call_sid,
+                status="failed" if error is not None else "initiated"
+            ))
+            if error is not None:
                 call_results.append({
-                    "contact_name": contact.name,
-                    "phone": contact.phone_number,
-                    "error": str(e)
+                    "contact_name": name,
+                    "phone": phone,
+                    "error": str(error)
                 })
+                continue
+            
+            call_results.append({
+                "contact_name": name,
+                "phone": phone,
+                "call_sid": call_sid,
+                "status": "initiated"
+            })
+        session.add_all(call_logs)
+        session.commit()
         
         return {
             "success": True,
@@ -441,7 +617,7 @@ def make_emergency_call(
         }
         
     except Exception as e:
-        print(f"    ❌ Emergency call failed: {e}")
+        log.error("❌ Emergency call failed: %s", e)
         return {"success": False, "error": str(e)}
     finally:
         session.close()
@@ -461,33 +637,30 @@ def send_emergency_sms(
     
     session = SessionLocal()
     try:
-        contacts = get_emergency_contacts(user_id, session) if not contact_id else [
-            session.query(models.EmergencyContact).filter(
-                models.EmergencyContact.id == contact_id
-            ).first()
-        ]
+        recipients = _recipients(session, user_id, contact_id)
+        targets = recipients[1] if recipients else ()
         
-        if not contacts:
+        if not targets:
             return {"success": False, "error": "No emergency contacts"}
         
         client = get_twilio_client()
         results = []
         
-        for contact in contacts[:3]:
+        for _, name, _, phone in targets:
             try:
                 sms = client.messages.create(
-                    to=contact.phone_number,
+                    to=phone,
                     from_=TWILIO_PHONE_NUMBER,
                     body=f"🚨 AEGIS HEALTH ALERT: {message}"
                 )
                 results.append({
-                    "contact": contact.name,
+                    "contact": name,
                     "sid": sms.sid,
                     "status": "sent"
                 })
             except Exception as e:
                 results.append({
-                    "contact": contact.name,
+                    "contact": name,
                     "error": str(e)
                 })
         
@@ -526,6 +699,41 @@ EMERGENCY_KEYWORDS = [
 ]
 
 
+def _categorize_keyword(keyword: str) -> Tuple[str, str]:
+    """Category and severity for a keyword (evaluated once per keyword at import)."""
+    category = "unknown"
+    if any(w in keyword for w in ["heart", "chest", "cardiac", "palpitations"]):
+        category = "cardiac"
+    elif any(w in keyword for w in ["stroke", "face", "speech", "numbness"]):
+        category = "stroke"
+    elif any(w in keyword for w in ["breath", "chok", "air", "throat", "asthma"]):
+        category = "respiratory"
+    elif any(w in keyword for w in ["suicidal", "die", "hurt myself"]):
+        category = "mental_health_crisis"
+    elif any(w in keyword for w in ["call", "ambulance", "911", "emergency"]):
+        category = "assistance_request"
+    severity = "critical" if category in ["cardiac", "stroke", "respiratory"] else "high"
+    return category, severity
+
+
+# (priority, keyword, category, severity); priority is the keyword's position in EMERGENCY_KEYWORDS
+_KEYWORD_INFO = [(i, kw, *_categorize_keyword(kw)) for i, kw in enumerate(EMERGENCY_KEYWORDS)]
+
+# All keywords in one Aho-Corasick automaton: a single pass over the text finds every match
+if ahocorasick is not None:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _info in _KEYWORD_INFO:
+        _KEYWORD_AUTOMATON.add_word(_info[1], _info)
+    _KEYWORD_AUTOMATON.make_automaton()
+else:
+    _KEYWORD_AUTOMATON = None
+
+# Without the automaton: every keyword's 3-char substrings. Text sharing none of them
+# can't contain any keyword, so most benign messages skip the per-keyword scan.
+_KEYWORD_SHINGLES = frozenset(kw[i:i + 3] for kw in EMERGENCY_KEYWORDS for i in range(len(kw) - 2))
+_HAS_SHORT_KEYWORD = any(len(kw) < 3 for kw in EMERGENCY_KEYWORDS)
+
+
 def detect_emergency_in_text(text: str) -> Optional[Dict[str, Any]]:
     """
     Detect emergency keywords/phrases in user message.
@@ -533,27 +741,24 @@ def detect_emergency_in_text(text: str) -> Optional[Dict[str, Any]]:
     """
     text_lower = text.lower()
     
-    for keyword in EMERGENCY_KEYWORDS:
-        if keyword in text_lower:
-            # Categorize the emergency
-            category = "unknown"
-            if any(w in keyword for w in ["heart", "chest", "cardiac", "palpitations"]):
-                category = "cardiac"
-            elif any(w in keyword for w in ["stroke", "face", "speech", "numbness"]):
-                category = "stroke"
-            elif any(w in keyword for w in ["breath", "chok", "air", "throat", "asthma"]):
-                category = "respiratory"
-            elif any(w in keyword for w in ["suicidal", "die", "hurt myself"]):
-                category = "mental_health_crisis"
-            elif any(w in keyword for w in ["call", "ambulance", "911", "emergency"]):
-                category = "assistance_request"
-            
-            return {
-                "detected": True,
-                "keyword": keyword,
-                "category": category,
-                "severity": "critical" if category in ["cardiac", "stroke", "respiratory"] else "high",
-                "original_text": text[:200]
-            }
+    if _KEYWORD_AUTOMATON is not None:
+        # Several keywords can match; report the one listed first, as the scan below does
+        match = min((info for _, info in _KEYWORD_AUTOMATON.iter(text_lower)), default=None)
+    elif not _HAS_SHORT_KEYWORD and _KEYWORD_SHINGLES.isdisjoint(
+        text_lower[i:i + 3] for i in range(len(text_lower) - 2)
+    ):
+        match = None
+    else:
+        match = next((info for info in _KEYWORD_INFO if info[1] in text_lower), None)
+    
+    if match is None:
+        return None
     
-    return None
+    _, keyword, category, severity = match
+    return {
+        "detected": True,
+        "keyword": keyword,
+        "category": category,
+        "severity": severity,
+        "original_text": text[:200]
+    }
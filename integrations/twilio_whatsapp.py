@@ -25,7 +25,18 @@ from enum import Enum
 from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from database import SessionLocal
+from integrations.twilio_client import get_client
 import models
 
 # ============================================================================
@@ -39,17 +50,43 @@ TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER", "")  # Format: what
 # Base URL for webhooks (use ngrok for local dev)
 AEGIS_BASE_URL = os.getenv("AEGIS_BASE_URL", "http://localhost:8000")
 
+# Booking sessions are kept in Redis when REDIS_URL is set, so every worker sees them;
+# otherwise they live in this process.
+REDIS_URL = os.getenv("REDIS_URL")
+SESSION_TTL_SECONDS = int(os.getenv("WHATSAPP_SESSION_TTL", "86400"))
+
+# Session blobs (message history included) are encoded in C when orjson is available
+_dumps = orjson.dumps if orjson is not None else json.dumps
+_loads = orjson.loads if orjson is not None else json.loads
+
+_redis = (
+    redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL, max_connections=32, decode_responses=True))
+    if redis is not None and REDIS_URL else None
+)
+
+
+_IS_CONFIGURED = bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_NUMBER)
+
 
 def is_whatsapp_configured() -> bool:
     """Check if WhatsApp is properly configured."""
-    return bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_NUMBER)
+    return _IS_CONFIGURED
+
+
+def reload_whatsapp_config():
+    """Re-read the TWILIO_* / WhatsApp environment variables (tests / runtime reconfiguration)."""
+    global TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER, _IS_CONFIGURED
+    TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+    TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+    TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER", "")
+    _IS_CONFIGURED = bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_NUMBER)
 
 
 def get_twilio_client() -> Optional[Client]:
     """Get Twilio client if configured."""
     if not is_whatsapp_configured():
         return None
-    return Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return get_client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
 
 # ============================================================================
@@ -67,11 +104,45 @@ class BookingState(Enum):
     EXPIRED = "expired"               # Conversation timed out
 
 
+_CLOSED_STATES = (BookingState.CONFIRMED.value, BookingState.REJECTED.value, BookingState.EXPIRED.value)
+
+
+def _phone_key(phone: str) -> str:
+    """Normalize a phone number ("whatsapp:+1 555..." -> "1 555...") for index lookups."""
+    return phone.replace("whatsapp:", "").replace("+", "").strip()
+
+
 class WhatsAppBookingSession:
     """Manages a WhatsApp booking conversation session."""
     
-    # In-memory store (use Redis in production)
+    # In-process store, used when Redis is not configured
     _sessions: Dict[str, Dict] = {}
+    # Normalized physician phone -> session_id of its latest open booking
+    _by_phone: Dict[str, str] = {}
+    
+    @classmethod
+    def _save(cls, session: Dict, index_phone: bool = False):
+        session_id = session["session_id"]
+        if _redis is None:
+            cls._sessions[session_id] = session
+            if index_phone:
+                cls._by_phone[session["_norm_phone"]] = session_id
+            return
+        pipe = _redis.pipeline()
+        pipe.set(f"whatsapp_session:{session_id}", _dumps(session), ex=SESSION_TTL_SECONDS)
+        if index_phone:
+            pipe.set(f"whatsapp_phone:{session['_norm_phone']}", session_id, ex=SESSION_TTL_SECONDS)
+        pipe.execute()
+    
+    @classmethod
+    def _unindex(cls, session: Dict):
+        """Drop the phone index entry once a booking is closed (if it still points here)."""
+        key = session["_norm_phone"]
+        if _redis is None:
+            if cls._by_phone.get(key) == session["session_id"]:
+                del cls._by_phone[key]
+        elif _redis.get(f"whatsapp_phone:{key}") == session["session_id"]:
+            _redis.delete(f"whatsapp_phone:{key}")
     
     @classmethod
     def create(
@@ -84,57 +155,91 @@ class WhatsAppBookingSession:
         reason: str = "General checkup"
     ) -> str:
         """Create a new booking session."""
-        session_id = f"booking_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        now = datetime.now()
+        session_id = f"booking_{user_id}_{now.strftime('%Y%m%d%H%M%S')}"
         
-        cls._sessions[session_id] = {
+        cls._save({
             "session_id": session_id,
             "user_id": user_id,
             "physician_phone": physician_phone,
+            "_norm_phone": _phone_key(physician_phone),  # normalized once, used for the phone index
             "physician_name": physician_name,
             "patient_name": patient_name,
             "preferred_time": preferred_time,
             "reason": reason,
             "state": BookingState.INITIATED.value,
-            "created_at": datetime.now().isoformat(),
+            "created_at": now.isoformat(),
             "messages": [],
             "confirmed_time": None
-        }
+        }, index_phone=True)
         
         return session_id
     
     @classmethod
     def get(cls, session_id: str) -> Optional[Dict]:
         """Get session by ID."""
-        return cls._sessions.get(session_id)
+        if _redis is None:
+            return cls._sessions.get(session_id)
+        raw = _redis.get(f"whatsapp_session:{session_id}")
+        return _loads(raw) if raw else None
     
     @classmethod
     def get_by_phone(cls, phone: str) -> Optional[Dict]:
         """Get active session by physician phone number."""
-        # Normalize phone format
-        phone_normalized = phone.replace("whatsapp:", "").strip()
-        
-        for session in cls._sessions.values():
-            if session["physician_phone"].replace("+", "").strip() == phone_normalized.replace("+", "").strip():
-                if session["state"] not in [BookingState.CONFIRMED.value, BookingState.REJECTED.value, BookingState.EXPIRED.value]:
-                    return session
+        key = _phone_key(phone)
+        session_id = cls._by_phone.get(key) if _redis is None else _redis.get(f"whatsapp_phone:{key}")
+        session = cls.get(session_id) if session_id else None
+        if session and session["state"] not in _CLOSED_STATES:
+            return session
         return None
     
+    @classmethod
+    def _modify(cls, session_id: str, mutate) -> Optional[Dict]:
+        """
+        Apply `mutate(session)` and store the result. In Redis mode the read-modify-write
+        runs under WATCH/MULTI (retried on conflict), so two workers handling webhooks
+        for the same booking can't overwrite each other's messages or state.
+        """
+        if _redis is None:
+            session = cls._sessions.get(session_id)
+            if session:
+                mutate(session)
+            return session
+        
+        key = f"whatsapp_session:{session_id}"
+        
+        def txn(pipe):
+            raw = pipe.get(key)
+            if not raw:
+                return None
+            session = _loads(raw)
+            mutate(session)
+            pipe.multi()
+            pipe.set(key, _dumps(session), ex=SESSION_TTL_SECONDS)
+            return session
+        
+        return _redis.transaction(txn, key, value_from_callable=True)
+    
     @classmethod
     def update_state(cls, session_id: str, state: BookingState, **kwargs):
         """Update session state."""
-        if session_id in cls._sessions:
-            cls._sessions[session_id]["state"] = state.value
-            cls._sessions[session_id].update(kwargs)
+        def mutate(session):
+            session["state"] = state.value
+            session.update(kwargs)
+        
+        session = cls._modify(session_id, mutate)
+        if session and state.value in _CLOSED_STATES:
+            cls._unindex(session)
     
     @classmethod
     def add_message(cls, session_id: str, direction: str, content: str):
         """Add message to session history."""
-        if session_id in cls._sessions:
-            cls._sessions[session_id]["messages"].append({
-                "direction": direction,  # "outgoing" or "incoming"
-                "content": content,
-                "timestamp": datetime.now().isoformat()
-            })
+        message = {
+            "direction": direction,  # "outgoing" or "incoming"
+            "content": content,
+            "timestamp": datetime.now().isoformat()
+        }
+        cls._modify(session_id, lambda session: session["messages"].append(message))
 
 
 # ============================================================================
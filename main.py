@@ -1,6 +1,8 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, UploadFile, File, Form
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, status, Request, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from passlib.context import CryptContext
@@ -9,10 +11,14 @@ from datetime import datetime, timedelta
 import os
 import time
 import shutil
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 import models, schemas, database, influx_ingester
 from agents import ingestor, sentinel
-from observability import log_api_call, log_agent_event
+from observability import log_api_call, log_agent_event, setup_queue_logging
 from alert_engine import evaluate_vitals, evaluate_sentinel_output
 from prometheus_fastapi_instrumentator import Instrumentator
 from metrics import AGENT_CALLS, AGENT_LATENCY
@@ -22,6 +28,10 @@ import aiofiles
 from fastapi.staticfiles import StaticFiles
 
 # ================== CONFIG ==================
+# Log records are written by a listener thread, not by the request that emits them
+setup_queue_logging()
+# Vitals responses can hold thousands of records; orjson encodes datetimes and floats in C
+VitalsResponse = ORJSONResponse if orjson is not None else JSONResponse
 models.Base.metadata.create_all(bind=database.engine)
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
@@ -187,6 +197,7 @@ def read_health_events_for_me(skip: int = 0, limit: int = 100, db: Session = Dep
 # ============== VITALS + ALERTS =============
 @app.post("/vitals/me")
 def log_vitals(vitals: schemas.VitalsLog,
+               background_tasks: BackgroundTasks,
                db: Session = Depends(get_db),
                current_user: models.User = Depends(get_current_user)):
 
@@ -238,19 +249,21 @@ def log_vitals(vitals: schemas.VitalsLog,
 
         response = {"status": "ALERT", "message": message}
     
-    # Check for sustained critical vitals and auto-trigger emergency call
+    # Only the threshold compare runs here; the sustained-critical history check and
+    # any Twilio calls run after the response has been sent
     try:
-        from integrations.twilio_emergency import auto_trigger_emergency_if_critical
-        emergency_result = auto_trigger_emergency_if_critical(current_user.id, vitals_data)
-        if emergency_result:
-            response["emergency_call"] = emergency_result
-            response["status"] = "EMERGENCY"
+        from integrations.twilio_emergency import check_critical_vitals, dispatch_if_sustained
+        critical_alerts = check_critical_vitals(vitals_data)
+        if critical_alerts:
+            background_tasks.add_task(dispatch_if_sustained, current_user.id, vitals_data)
+            response["critical_alerts"] = critical_alerts
+            response["emergency_check"] = "scheduled"
     except Exception as e:
         print(f"[EMERGENCY CHECK ERROR] {e}")
 
     return response
 
-@app.get("/vitals/me", response_model=List[Dict[str, Any]])
+@app.get("/vitals/me", response_model=List[Dict[str, Any]], response_class=VitalsResponse)
 def read_vitals(range: str = "-1h", current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     Reads the time-series vital signs data for the current user from HealthEvents table.
@@ -286,6 +299,29 @@ def read_vitals(range: str = "-1h", current_user: models.User = Depends(get_curr
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/vitals/me/stream", tags=["Vitals"])
+def stream_vitals(range: str = "-1h", current_user: models.User = Depends(get_current_user)):
+    """
+    Streams the user's InfluxDB vitals as NDJSON, one record per line, as they
+    are read, instead of building the whole result set first.
+    """
+    try:
+        influx_ingester.validate_time_range(range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def ndjson():
+        records = influx_ingester.query_vitals_stream(current_user.id, range)
+        if orjson is not None:
+            opts = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE
+            for record in records:
+                yield orjson.dumps(record, default=str, option=opts)
+        else:
+            for record in records:
+                yield json.dumps(record, default=str) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @app.get("/alerts/me", response_model=List[schemas.Alert])
 def get_alerts(db: Session = Depends(get_db),
                current_user: models.User = Depends(get_current_user)):
@@ -400,6 +436,62 @@ def get_latest_watch_vitals(
 
 
 # ============== ANALYZE DOCUMENT ============
+def _save_structured_data(db: Session, user_id: int, structured_data: dict):
+    """Adds the ETL output for one document to the session; the caller commits."""
+    # Medications
+    for med in structured_data.get("medications", []):
+        db_med = models.Medication(
+            user_id=user_id,
+            name=med.get("name"),
+            dosage=med.get("dosage"),
+            frequency=med.get("frequency"),
+            status=med.get("status", "Active")
+        )
+        db.add(db_med)
+        
+    # Conditions
+    for cond in structured_data.get("conditions", []):
+        db_cond = models.Condition(
+            user_id=user_id,
+            name=cond.get("name"),
+            diagnosis_date=cond.get("diagnosis_date"),
+            status=cond.get("status", "Active")
+        )
+        db.add(db_cond)
+        
+    # Allergies
+    for alg in structured_data.get("allergies", []):
+        db_alg = models.Allergy(
+            user_id=user_id,
+            allergen=alg.get("allergen"),
+            reaction=alg.get("reaction"),
+            severity=alg.get("severity")
+        )
+        db.add(db_alg)
+        
+    # Lab Results
+    for lab in structured_data.get("lab_results", []):
+        db_lab = models.LabResult(
+            user_id=user_id,
+            test_name=lab.get("test_name"),
+            value=str(lab.get("value")), # Ensure string
+            unit=lab.get("unit"),
+            reference_range=lab.get("reference_range"),
+            date=lab.get("date")
+        )
+        db.add(db_lab)
+
+    # Medical Notes
+    for note in structured_data.get("medical_notes", []):
+        db_note = models.MedicalNote(
+            user_id=user_id,
+            date=note.get("date"),
+            provider=note.get("provider"),
+            note_text=note.get("note_text"),
+            summary=note.get("summary")
+        )
+        db.add(db_note)
+
 @app.post("/analyze/document", tags=["Agents"])
 def analyze_document(
     file: UploadFile = File(...),
@@ -431,60 +523,7 @@ def analyze_document(
                 
                 # Save to DB
                 if structured_data:
-                    # Medications
-                    for med in structured_data.get("medications", []):
-                        db_med = models.Medication(
-                            user_id=current_user.id,
-                            name=med.get("name"),
-                            dosage=med.get("dosage"),
-                            frequency=med.get("frequency"),
-                            status=med.get("status", "Active")
-                        )
-                        db.add(db_med)
-                        
-                    # Conditions
-                    for cond in structured_data.get("conditions", []):
-                        db_cond = models.Condition(
-                            user_id=current_user.id,
-                            name=cond.get("name"),
-                            diagnosis_date=cond.get("diagnosis_date"),
-                            status=cond.get("status", "Active")
-                        )
-                        db.add(db_cond)
-                        
-                    # Allergies
-                    for alg in structured_data.get("allergies", []):
-                        db_alg = models.Allergy(
-                            user_id=current_user.id,
-                            allergen=alg.get("allergen"),
-                            reaction=alg.get("reaction"),
-                            severity=alg.get("severity")
-                        )
-                        db.add(db_alg)
-                        
-                    # Lab Results
-                    for lab in structured_data.get("lab_results", []):
-                        db_lab = models.LabResult(
-                            user_id=current_user.id,
-                            test_name=lab.get("test_name"),
-                            value=str(lab.get("value")), # Ensure string
-                            unit=lab.get("unit"),
-                            reference_range=lab.get("reference_range"),
-                            date=lab.get("date")
-                        )
-                        db.add(db_lab)
-
-                    # Medical Notes
-                    for note in structured_data.get("medical_notes", []):
-                        db_note = models.MedicalNote(
-                            user_id=current_user.id,
-                            date=note.get("date"),
-                            provider=note.get("provider"),
-                            note_text=note.get("note_text"),
-                            summary=note.get("summary")
-                        )
-                        db.add(db_note)
-                        
+                    _save_structured_data(db, current_user.id, structured_data)
                     db.commit()
                     print(f"[ETL] Saved structured data for User {current_user.id}")
         except Exception as e:
@@ -504,6 +543,74 @@ def analyze_document(
         if os.path.exists(temp):
             os.remove(temp)
 
+@app.post("/analyze/documents", tags=["Agents"])
+def analyze_documents(
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk version of /analyze/document for a patient's historical records.
+    Every file is ingested first, then the structured-data ETL runs over all of
+    them in one batched call.
+    """
+    results = []
+    markdowns = []
+    for file in files:
+        temp = f"temp_{uuid.uuid4().hex}_{file.filename}"
+        with open(temp, "wb") as f:
+            f.write(file.file.read())
+        try:
+            AGENT_CALLS.labels("Ingestor").inc()
+            t0 = time.perf_counter()
+            data = ingestor.extract_medical_data(temp, user_id=current_user.id)
+            AGENT_LATENCY.labels("Ingestor").observe(time.perf_counter() - t0)
+        except Exception as e:
+            data = {"error": str(e)}
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+        if data.get("error"):
+            results.append({"filename": file.filename, "status": "error", "detail": data["error"]})
+            continue
+        results.append({
+            "filename": file.filename,
+            "status": "success",
+            "analysis": data.get("markdown", ""),
+            "page_count": data.get("page_count", 1),
+            "kb_path": data.get("kb_path"),
+        })
+        if data.get("markdown"):
+            markdowns.append(data["markdown"])
+
+    # TRIGGER ETL: one batched extraction for every document that produced text
+    try:
+        if markdowns:
+            for structured_data in sentinel.sentinel.extract_structured_data_batch(markdowns):
+                if structured_data:
+                    _save_structured_data(db, current_user.id, structured_data)
+            db.commit()
+            print(f"[ETL] Saved structured data for {len(markdowns)} documents for User {current_user.id}")
+    except Exception as e:
+        print(f"[ETL ERROR] Failed to save structured data: {e}")
+
+    return {"status": "success", "documents": results}
+
+@app.post("/analyze/record/stream", tags=["Agents"])
+def stream_record_analysis(
+    record: Dict[str, Any],
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Runs the Sentinel analysis on an extracted medical record and streams the
+    output as plain text while the graph generates it.
+    """
+    AGENT_CALLS.labels("Sentinel").inc()
+    user_context = f"User: {current_user.email}"
+    chunks = sentinel.sentinel.analyze_health_record_stream(record, user_context=user_context)
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+
 @app.post("/analyze/vision", tags=["Agents"])
 async def analyze_vision(
     file: UploadFile = File(...),
@@ -1108,6 +1215,15 @@ def get_emergency_contacts(
     return contacts
 
 
+def _invalidate_emergency_recipients(user_id: int):
+    """Drop the emergency module's cached contacts for a user after an edit."""
+    try:
+        from integrations.twilio_emergency import invalidate_user
+    except Exception:
+        return  # Module never loaded, so nothing is cached
+    invalidate_user(user_id)
+
+
 @app.post("/emergency/contacts", response_model=EmergencyContactResponse, tags=["Emergency"])
 def add_emergency_contact(
     contact: EmergencyContactCreate,
@@ -1126,6 +1242,7 @@ def add_emergency_contact(
     )
     db.add(new_contact)
     db.commit()
+    _invalidate_emergency_recipients(current_user.id)
     db.refresh(new_contact)
     return new_contact
 
@@ -1154,6 +1271,7 @@ def update_emergency_contact(
     existing.notify_on_critical = "true" if contact.notify_on_critical else "false"
     
     db.commit()
+    _invalidate_emergency_recipients(current_user.id)
     db.refresh(existing)
     return existing
 
@@ -1175,6 +1293,7 @@ def delete_emergency_contact(
     
     db.delete(existing)
     db.commit()
+    _invalidate_emergency_recipients(current_user.id)
     return {"status": "deleted", "id": contact_id}
 
 
@@ -1283,6 +1402,22 @@ def delete_physician(
     return {"status": "deleted", "id": physician_id}
 
 
+def _update_call_log(call_sid: str, **fields):
+    """Set fields on the EmergencyCallLog for a Twilio CallSid (blocking; run in the threadpool)."""
+    db = database.SessionLocal()
+    try:
+        call_log = db.query(models.EmergencyCallLog).filter(
+            models.EmergencyCallLog.call_sid == call_sid
+        ).first()
+        
+        if call_log:
+            for name, value in fields.items():
+                setattr(call_log, name, value)
+            db.commit()
+    finally:
+        db.close()
+
+
 @app.post("/emergency/status", tags=["Emergency"])
 async def emergency_call_status_webhook(
     CallSid: str = Form(None),
@@ -1296,21 +1431,13 @@ async def emergency_call_status_webhook(
     """
     print(f"[EMERGENCY STATUS] CallSid: {CallSid}, Status: {CallStatus}, Duration: {CallDuration}s")
     
-    db = database.SessionLocal()
-    try:
-        call_log = db.query(models.EmergencyCallLog).filter(
-            models.EmergencyCallLog.call_sid == CallSid
-        ).first()
-        
-        if call_log:
-            call_log.status = CallStatus
-            if CallDuration:
-                call_log.duration_seconds = int(CallDuration)
-            if RecordingUrl:
-                call_log.recording_url = RecordingUrl
-            db.commit()
-    finally:
-        db.close()
+    fields = {"status": CallStatus}
+    if CallDuration:
+        fields["duration_seconds"] = int(CallDuration)
+    if RecordingUrl:
+        fields["recording_url"] = RecordingUrl
+    # The DB write blocks: keep it off the event loop
+    await run_in_threadpool(_update_call_log, CallSid, **fields)
     
     return {"status": "received"}
 
@@ -1328,16 +1455,7 @@ async def emergency_call_callback_webhook(
     
     if Digits == "1":
         # Acknowledged
-        db = database.SessionLocal()
-        try:
-            call_log = db.query(models.EmergencyCallLog).filter(
-                models.EmergencyCallLog.call_sid == CallSid
-            ).first()
-            if call_log:
-                call_log.status = "acknowledged"
-                db.commit()
-        finally:
-            db.close()
+        await run_in_threadpool(_update_call_log, CallSid, status="acknowledged")
         
         twiml = """<?xml version="1.0" encoding="UTF-8"?>
 <Response>
@@ -1378,7 +1496,8 @@ async def whatsapp_incoming_webhook(
     try:
         from integrations.twilio_whatsapp import process_incoming_message, generate_webhook_response
         
-        result = process_incoming_message(From, Body)
+        # Session lookup, the reply send and the appointment insert all block
+        result = await run_in_threadpool(process_incoming_message, From, Body)
         
         print(f"[WHATSAPP] Action: {result.get('action')}")
         
@@ -0,0 +1,44 @@
+"""
+Migration: Make daily_summaries.date a DATE column and index (user_id, date)
+
+Run this script to convert the YYYY-MM-DD strings to a native DATE and add the
+composite index used by the "last N days for a user" summary lookups.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+from sqlalchemy import text
+
+def run_migration() -> bool:
+    print("🔄 Running migration: daily_summaries.date -> DATE + (user_id, date) index...")
+    
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_daily_summaries_user_date ON daily_summaries (user_id, date)",
+    ]
+    if engine.dialect.name == "postgresql":
+        # SQLite already stores SQLAlchemy Date values as YYYY-MM-DD text, so only Postgres needs the cast
+        statements.insert(0, "ALTER TABLE daily_summaries ALTER COLUMN date TYPE DATE USING date::date")
+    
+    # Each statement gets its own transaction: on Postgres a failed statement aborts
+    # the transaction it runs in, which would take the remaining statements down with it
+    failed = 0
+    for stmt in statements:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(stmt))
+            print(f"  ✅ {stmt[:60]}...")
+        except Exception as e:
+            failed += 1
+            print(f"  ❌ Error: {e}")
+    
+    if failed:
+        print(f"\n❌ Migration failed: {failed} of {len(statements)} statements did not apply")
+        return False
+    print("\n✅ Migration complete!")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if run_migration() else 1)
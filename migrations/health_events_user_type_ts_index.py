@@ -0,0 +1,32 @@
+"""
+Migration: Index health_events on (user_id, event_type, timestamp DESC)
+
+Run this script to add the composite index used by the per-user sustained-critical
+check in integrations/twilio_emergency.py.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+from sqlalchemy import text
+
+def run_migration() -> bool:
+    print("🔄 Running migration: health_events (user_id, event_type, timestamp DESC) index...")
+    
+    stmt = "CREATE INDEX IF NOT EXISTS ix_health_events_user_type_ts ON health_events (user_id, event_type, timestamp DESC)"
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(stmt))
+        print(f"  ✅ {stmt[:60]}...")
+    except Exception as e:
+        print(f"  ❌ Error: {e}")
+        print("\n❌ Migration failed: the index was not created")
+        return False
+    
+    print("\n✅ Migration complete!")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if run_migration() else 1)
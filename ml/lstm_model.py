@@ -1,7 +1,45 @@
+import os
 import numpy as np
 
-# In a real scenario, this would import torch and load a trained model.
-# For this restored version, we use a heuristic based on clinical thresholds.
+# If a trained LSTM has been exported to ONNX it is loaded once at import,
+# dynamically quantized to int8 weights (cached next to the fp32 file).
+# Otherwise we use a heuristic based on clinical thresholds.
+LSTM_MODEL_PATH = os.getenv("AEGIS_LSTM_MODEL", "ml/models/vitals_lstm.onnx")
+USE_FP32_LSTM = os.getenv("AEGIS_LSTM_FP32", "0") == "1"  # regression debugging
+
+def _load_lstm_session():
+    if not os.path.exists(LSTM_MODEL_PATH):
+        return None
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print("[LSTM] onnxruntime not installed - using heuristic risk model.")
+        return None
+
+    path = LSTM_MODEL_PATH
+    try:
+        if not USE_FP32_LSTM:
+            int8_path = os.path.splitext(LSTM_MODEL_PATH)[0] + ".int8.onnx"
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(LSTM_MODEL_PATH, int8_path, weight_type=QuantType.QInt8)
+                print(f"[LSTM] Wrote int8 model to {int8_path}")
+            path = int8_path
+
+        session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        # Warm-up run so the first real request doesn't pay graph initialisation
+        session.run(None, {session.get_inputs()[0].name: np.zeros((1, 32, 6), dtype=np.float32)})
+        print(f"[LSTM] Loaded {path}")
+        return session
+    except Exception as e:
+        print(f"[LSTM] Failed to load {path}: {e} - using heuristic risk model.")
+        return None
+
+_lstm_session = _load_lstm_session()
+
+def _run_lstm(batch):
+    inputs = {_lstm_session.get_inputs()[0].name: np.asarray(batch, dtype=np.float32)}
+    return _lstm_session.run(None, inputs)[0].reshape(-1)
 
 def predict_risk(sequence):
     """
@@ -12,6 +50,9 @@ def predict_risk(sequence):
     if not isinstance(sequence, np.ndarray):
         return 0.1
 
+    if _lstm_session is not None and sequence.ndim == 2:
+        return float(_run_lstm(sequence[np.newaxis])[0])
+
     # Extract features (assuming the order matches the docstring in sentinel.py)
     # [heartrate, resprate, o2sat, sbp, dbp, temperature]
     try:
@@ -0,0 +1,59 @@
+"""
+Vitals risk scoring on top of ml/lstm_model.py.
+Windows are (N, 6) float32 arrays in VITALS_FEATURES order, or DataFrames with those columns.
+"""
+
+import threading
+import numpy as np
+from ml.lstm_model import predict_risk
+from ml.risk_kernels import RISK_LEVELS, classify_risk, pad_into
+
+def assess_risk_from_vitals(sequence):
+    risk = predict_risk(sequence)
+    return risk, RISK_LEVELS[classify_risk(risk)]
+
+VITALS_FEATURES = ["heartrate","resprate","o2sat","sbp","dbp","temperature"]
+
+# Per-thread padding buffers keyed by max_steps; reused across calls
+_pad_buffers = threading.local()
+
+def _pad_buffer(max_steps):
+    buffers = getattr(_pad_buffers, "by_steps", None)
+    if buffers is None:
+        buffers = _pad_buffers.by_steps = {}
+    buf = buffers.get(max_steps)
+    if buf is None:
+        buf = buffers[max_steps] = np.zeros((max_steps, len(VITALS_FEATURES)), dtype=np.float32)
+    return buf
+
+def vitals_to_array(vitals_df):
+    """Materializes a vitals DataFrame as a contiguous (N, 6) float32 array."""
+    return np.ascontiguousarray(vitals_df[VITALS_FEATURES].to_numpy(dtype=np.float32))
+
+def materialize_vitals_by_stay(vitals_df, stay_col="stay_id"):
+    """
+    Converts a multi-stay vitals DataFrame into {stay_id: (N, 6) float32 array}
+    once, so risk scoring works on plain arrays instead of re-indexing pandas.
+    Rows are expected to be sorted by time within each stay.
+    """
+    return {stay_id: vitals_to_array(group) for stay_id, group in vitals_df.groupby(stay_col, sort=False)}
+
+def compute_risk_from_vitals_window(vitals, max_steps=32):
+    """
+    vitals: pandas DataFrame with columns
+      ['heartrate','resprate','o2sat','sbp','dbp','temperature']
+      for a single stay_id sorted by time, or the same data as an (N, 6)
+      float32 array (see materialize_vitals_by_stay).
+    """
+    seq = vitals if isinstance(vitals, np.ndarray) else vitals_to_array(vitals)
+
+    if len(seq) >= max_steps:
+        # same truncation as training; a view, no copy
+        window = seq[:max_steps]
+    else:
+        # same zero padding as training, into a reused buffer
+        window = _pad_buffer(max_steps)
+        pad_into(seq, window)
+
+    risk = predict_risk(window)
+    return risk, RISK_LEVELS[classify_risk(risk)]
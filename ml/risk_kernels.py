@@ -0,0 +1,48 @@
+import numpy as np
+
+# Small JIT kernels for risk scoring. Numba is optional: without it the same
+# functions run as plain Python/NumPy and produce identical results.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+HIGH_RISK_THRESHOLD = 0.85
+MEDIUM_RISK_THRESHOLD = 0.6
+
+
+@njit(cache=True, fastmath=True)
+def pad_into(seq, out):
+    """
+    Copies seq (steps, features) into the preallocated out buffer, truncating
+    to out.shape[0] rows and zero-filling the tail. Returns the rows copied.
+    """
+    rows = min(seq.shape[0], out.shape[0])
+    cols = out.shape[1]
+    for i in range(rows):
+        for j in range(cols):
+            out[i, j] = seq[i, j]
+    for i in range(rows, out.shape[0]):
+        for j in range(cols):
+            out[i, j] = 0.0
+    return rows
+
+
+@njit(cache=True)
+def classify_risk(risk):
+    """Returns an index into RISK_LEVELS: 2 HIGH, 1 MEDIUM, 0 LOW."""
+    # Branchless: each threshold crossed bumps the level by one
+    return int(risk > MEDIUM_RISK_THRESHOLD) + int(risk > HIGH_RISK_THRESHOLD)
+
+
+if NUMBA_AVAILABLE:
+    # Compile (or load from the on-disk cache) now rather than on the first request
+    pad_into(np.zeros((1, 6), dtype=np.float32), np.empty((2, 6), dtype=np.float32))
+    classify_risk(0.5)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, JSON, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -34,6 +34,13 @@ class HealthEvent(Base):
 
     owner = relationship("User", back_populates="health_events")
 
+    # "Latest event of a type" lookups walk this index backwards and stop at the first match
+    # (user_id, event_type, timestamp DESC) serves the per-user sustained-critical window scan
+    __table_args__ = (
+        Index("ix_health_events_type_ts", "event_type", timestamp.desc()),
+        Index("ix_health_events_user_type_ts", "user_id", "event_type", timestamp.desc()),
+    )
+
 class Alert(Base):
     __tablename__ = "alerts"
 
@@ -126,11 +133,14 @@ class DailySummary(Base):
     __tablename__ = "daily_summaries"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    date = Column(String, index=True) # YYYY-MM-DD
+    date = Column(Date, index=True)
     summary = Column(String)
     mood = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Serves the common "user_id = ? AND date >= ?" range lookups
+    __table_args__ = (Index("ix_daily_summaries_user_date", "user_id", "date"),)
+
 class HealthGoal(Base):
     __tablename__ = "health_goals"
     id = Column(Integer, primary_key=True, index=True)
@@ -1,8 +1,30 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 
 logger = logging.getLogger("aegis")
 logging.basicConfig(level=logging.INFO)
 
+_log_listener = None
+
+def setup_queue_logging():
+    """
+    Call once at app startup. The root logger's handlers move behind a queue drained
+    by one listener thread, so code on the request/emergency path never blocks on a
+    stdout write; records still go to the same handlers with the app's configuration.
+    Modules just use logging.getLogger("aegis.<name>").
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    root = logging.getLogger()
+    log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
 def log_api_call(func):
     # Decorator stub
     return func
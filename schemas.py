@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, EmailStr
+from datetime import date as Date, datetime
 from typing import Optional, Dict, Any, List
 from models import OperatingMode
 
@@ -271,9 +271,52 @@ class HealthGoal(HealthGoalBase):
 class DailySummary(BaseModel):
     id: int
     user_id: int
-    date: datetime
+    date: Date
     summary: str
     mood: Optional[str] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+# --- Sentinel ETL output (see SentinelAgent.extract_structured_data) ---
+# Numbers the model emits for text fields (e.g. lab values) are coerced to str.
+
+class ExtractedMedication(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+    name: str
+    dosage: Optional[str] = None
+    frequency: Optional[str] = None
+    status: Optional[str] = "Active"
+
+class ExtractedCondition(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+    name: str
+    diagnosis_date: Optional[str] = None
+    status: Optional[str] = "Active"
+
+class ExtractedAllergy(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+    allergen: str
+    reaction: Optional[str] = None
+    severity: Optional[str] = None
+
+class ExtractedLabResult(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+    test_name: str
+    value: Optional[str] = None
+    unit: Optional[str] = None
+    reference_range: Optional[str] = None
+    date: Optional[str] = None
+
+class ExtractedNote(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+    date: Optional[str] = None
+    provider: Optional[str] = None
+    note_text: Optional[str] = None
+    summary: Optional[str] = None
+
+class ExtractedRecord(BaseModel):
+    medications: List[ExtractedMedication] = []
+    conditions: List[ExtractedCondition] = []
+    allergies: List[ExtractedAllergy] = []
+    lab_results: List[ExtractedLabResult] = []
+    medical_notes: List[ExtractedNote] = []
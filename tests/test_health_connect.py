@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pydantic")
+pytest.importorskip("sqlalchemy")
+
+from integrations.health_connect import HealthConnectReading, normalize_vitals
+
+
+def _normalize(payload):
+    return normalize_vitals(HealthConnectReading.model_validate(payload).model_dump())
+
+
+def test_aliases_map_to_canonical_names():
+    vitals = _normalize({"heartRate": 72, "bloodOxygen": 97, "stepCount": 1200, "respiratoryRate": 14})
+    assert vitals == {"heart_rate": 72, "spo2": 97, "steps": 1200, "respiratory_rate": 14}
+
+
+def test_non_vital_fields_are_dropped():
+    vitals = _normalize({"hr": 60, "height": 180, "distance": 5000, "source": "galaxy_watch"})
+    assert vitals == {"heart_rate": 60}
+
+
+def test_zero_and_missing_values_are_skipped():
+    assert _normalize({"heart_rate": 0, "spo2": None}) == {}
+
+
+def test_blood_pressure_needs_both_values():
+    assert _normalize({"systolic": 120, "heart_rate": 70}) == {"heart_rate": 70}
+    assert _normalize({"bloodPressureSystolic": 120, "bloodPressureDiastolic": 80}) == {
+        "systolic_bp": 120,
+        "diastolic_bp": 80,
+    }
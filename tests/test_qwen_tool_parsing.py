@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from agents.qwen_llm import _find_json_blocks
+
+
+def test_plain_and_json_tagged_fences():
+    text = 'First:\n```\n{"a": 1}\n```\nthen\n```json\n{"b": 2}\n```'
+    assert _find_json_blocks(text) == ['{"a": 1}', '{"b": 2}']
+
+
+def test_nested_object_is_returned_whole():
+    block = '{"tool": "find_physician", "tool_input": {"location": {"lat": 1.5, "lon": 2}}}'
+    blocks = _find_json_blocks(f"```json\n{block}\n```")
+    assert blocks == [block]
+    assert json.loads(blocks[0])["tool_input"]["location"]["lon"] == 2
+
+
+def test_braces_and_quotes_inside_strings_are_ignored():
+    block = r'{"tool": "note", "tool_input": {"text": "a } b { c \" } d"}}'
+    assert _find_json_blocks(f"```json\n{block}\n```") == [block]
+
+
+def test_multiple_fenced_blocks_keep_order():
+    calls = [{"tool": f"t{i}", "tool_input": {"n": i}} for i in range(3)]
+    text = "\n".join(f"Step {i}:\n```json\n{json.dumps(c)}\n```" for i, c in enumerate(calls))
+    assert [json.loads(b) for b in _find_json_blocks(text)] == calls
+
+
+def test_unterminated_block_is_skipped():
+    text = '```json\n{"tool": "a", "tool_input": {"x": 1}\n```\n```json\n{"tool": "b"}\n```'
+    assert _find_json_blocks(text) == ['{"tool": "b"}']
+
+
+def test_unterminated_block_at_end_of_text():
+    assert _find_json_blocks('```json\n{"tool": "a", "tool_input": {') == []
+
+
+def test_fence_without_object_and_no_fences():
+    assert _find_json_blocks("```python\nprint(1)\n```") == []
+    assert _find_json_blocks('no fences here {"tool": "a"}') == []
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+
+from integrations import twilio_emergency
+from integrations.twilio_emergency import check_critical_vitals, critical_details, detect_emergency_in_text
+
+
+def test_normal_reading_has_no_alerts():
+    assert check_critical_vitals({"heart_rate": 72, "spo2": 98, "systolic_bp": 120, "diastolic_bp": 80}) == []
+
+
+def test_missing_vitals_are_not_critical():
+    assert critical_details([{}, {"heart_rate": None}]) == []
+
+
+def test_low_and_high_values_in_row_then_vital_order():
+    readings = [
+        {"heart_rate": 72, "spo2": 85},
+        {"heart_rate": 170, "temperature": 34.0},
+    ]
+    alerts = critical_details(readings)
+    assert [(a["vital"], a["value"], a["threshold"]) for a in alerts] == [
+        ("spo2", 85, "< 88"),
+        ("heart_rate", 170, "> 150"),
+        ("temperature", 34.0, "< 35.0"),
+    ]
+    assert alerts[0]["message"] == "Spo2 critically low: 85"
+    assert all(a["severity"] == "CRITICAL" for a in alerts)
+
+
+def test_limit_caps_the_alerts():
+    readings = [{"heart_rate": 20}, {"heart_rate": 200}, {"spo2": 70}]
+    assert len(critical_details(readings, limit=2)) == 2
+
+
+def test_threshold_values_themselves_are_not_critical():
+    assert check_critical_vitals({"heart_rate": 40, "spo2": 88, "respiratory_rate": 30}) == []
+
+
+@pytest.fixture(params=["automaton", "scan"])
+def detection_path(request, monkeypatch):
+    if request.param == "scan":
+        monkeypatch.setattr(twilio_emergency, "_KEYWORD_AUTOMATON", None)
+    elif twilio_emergency._KEYWORD_AUTOMATON is None:
+        pytest.skip("pyahocorasick not installed")
+    return request.param
+
+
+def test_detects_keyword_with_category(detection_path):
+    result = detect_emergency_in_text("I have CHEST PAIN and feel dizzy")
+    assert result["detected"] is True
+    assert result["keyword"] == "chest pain"
+    assert result["category"] == "cardiac"
+    assert result["severity"] == "critical"
+
+
+def test_first_listed_keyword_wins(detection_path):
+    # "help me" and "stroke" both match; "stroke" comes first in EMERGENCY_KEYWORDS
+    result = detect_emergency_in_text("help me, I think it's a stroke")
+    assert result["keyword"] == "stroke"
+    assert result["category"] == "stroke"
+
+
+def test_benign_text_is_not_an_emergency(detection_path):
+    assert detect_emergency_in_text("What should I eat for breakfast?") is None
+
+
+def test_original_text_is_truncated():
+    result = detect_emergency_in_text("call 911 " + "x" * 500)
+    assert result["category"] == "assistance_request"
+    assert len(result["original_text"]) == 200
@@ -887,7 +887,7 @@ def read_medical_history(query: str, user_id: int = None) -> str:
     print(f"[TOOL] 📖 Reading Medical History for User {user_id}: {query}")
     print(f"[TOOL] 🔍 Search terms: {search_terms}")
     
-    kb_base = "d:\\Aegis\\knowledge_base"
+    kb_base = os.getenv("AEGIS_KB_DIR", "d:\\Aegis\\knowledge_base")
     
     # User-specific directory
     if user_id:
@@ -1120,7 +1120,7 @@ def get_daily_summaries(days: int = 7, user_id: int = None) -> str:
     print(f"[TOOL] 📜 Fetching Summaries for last {days} days")
     session = SessionLocal()
     try:
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=days)).date()
         summaries = session.query(models.DailySummary).filter(
             models.DailySummary.user_id == user_id,
             models.DailySummary.date >= start_date
@@ -1173,7 +1173,7 @@ def analyze_health_topic(topic: str, user_id: int = None) -> str:
     # 1. Get recent summaries related to the topic
     session = SessionLocal()
     try:
-        start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=30)).date()
         summaries = session.query(models.DailySummary).filter(
             models.DailySummary.user_id == user_id,
             models.DailySummary.date >= start_date